@@ -77,6 +77,19 @@ class HRVAnalysis:
         except sqlite3.Error as e:
             print(f"Database error: {e}")
     
+    def load_hrv_records(self, export_dir=None, columns=None, year=None, month=None):
+        """Load beat-to-beat HRV records from the parquet export of hrv_parquet_export.py"""
+        return self._load_hrv_table('hrv_records', export_dir, columns, year, month)
+    
+    def load_hrv_sessions(self, export_dir=None, columns=None, year=None, month=None):
+        """Load HRV sessions from the parquet export of hrv_parquet_export.py"""
+        return self._load_hrv_table('hrv_sessions', export_dir, columns, year, month)
+    
+    def _load_hrv_table(self, table, export_dir, columns, year, month):
+        # pyarrow is only needed for the parquet export, the SQLite analysis runs without it
+        from hrv_parquet_export import EXPORT_DIR, load_hrv_table
+        return load_hrv_table(table, export_dir or EXPORT_DIR, columns, year, month)
+    
     def visualize_hrv_metrics(self):
         # (Keep the existing visualization method)
         plt.style.use('seaborn')
@@ -5,7 +5,7 @@ __copyright__ = "Copyright Tom Goetz"
 __license__ = "GPL"
 
 import logging
-from sqlalchemy import Integer, DateTime, String, ForeignKey
+from sqlalchemy import Integer, DateTime, String, ForeignKey, event
 
 from garmindb import ActivityFitPluginBase
 
@@ -68,24 +68,63 @@ class fbb_hrv(ActivityFitPluginBase):
     _tables = {}
     _views = {'activity_view': create_activity_view}
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._activity_id = None
+        self._record_nums = set()
+        self._pending_records = []
+        # the activity session is committed once per file, flush the records of the file before that
+        self._flush_on_commit = self._write_pending_records
+        self._drop_on_rollback = self._drop_pending_records
+
+    def _listen_to_session(self, activity_db_session):
+        """Write the pending records when the session of the current file is committed, drop them on rollback."""
+        if not event.contains(activity_db_session, 'before_commit', self._flush_on_commit):
+            event.listen(activity_db_session, 'before_commit', self._flush_on_commit)
+            event.listen(activity_db_session, 'after_rollback', self._drop_on_rollback)
+
+    def _existing_record_nums(self, activity_db_session, activity_id):
+        """Return the record numbers already stored for the activity, loaded with one query per activity."""
+        if activity_id != self._activity_id:
+            self._listen_to_session(activity_db_session)
+            record_table = self._tables['record']
+            query = activity_db_session.query(record_table.record).filter(record_table.activity_id == activity_id)
+            self._activity_id = activity_id
+            self._record_nums = {record_num for (record_num,) in query}
+        return self._record_nums
+
+    def _write_pending_records(self, activity_db_session):
+        """Insert the records collected for the current activity in bulk."""
+        if self._pending_records:
+            logger.debug("writing %d hrv records for activity %s", len(self._pending_records), self._activity_id)
+            activity_db_session.bulk_insert_mappings(self._tables['record'], self._pending_records)
+            self._pending_records = []
+
+    def _drop_pending_records(self, activity_db_session):
+        """Forget the records of a rolled back file, they are loaded again for the activity."""
+        self._activity_id = None
+        self._record_nums = set()
+        self._pending_records = []
+
     def write_record_entry(self, activity_db_session, fit_file, activity_id, message_fields, record_num):
-        """Write a record message into the plugin records table."""
-        record_table = self._tables['record']
-        if not record_table.s_exists(activity_db_session, {'activity_id' : activity_id, 'record' : record_num}):
-            record = {
+        """Collect a record message for the plugin records table, written in bulk at the end of the file."""
+        record_nums = self._existing_record_nums(activity_db_session, activity_id)
+        if record_num not in record_nums:
+            record_nums.add(record_num)
+            self._pending_records.append({
                 'activity_id'   : activity_id,
                 'record'        : record_num,
                 'timestamp'     : fit_file.utc_datetime_to_local(message_fields.timestamp),
                 'hrv_s'         : message_fields.get('dev_hrv_s'),
                 'hrv_btb'       : message_fields.get('dev_hrv_btb'),
                 'hrv_hr'        : message_fields.get('dev_hrv_hr'),
-            }
-            logger.debug("writing hrv record %r for %s", record, fit_file.filename)
-            activity_db_session.add(record_table(**record))
+            })
         return {}
 
     def write_session_entry(self, activity_db_session, fit_file, activity_id, message_fields):
-        """Write a session message into the plugin sessions table."""
+        """Write the collected records and a session message into the plugin tables."""
+        if activity_id == self._activity_id:
+            self._write_pending_records(activity_db_session)
         session_table = self._tables['session']
         if not session_table.s_exists(activity_db_session, {'activity_id' : activity_id}):
             session = {
@@ -0,0 +1,207 @@
+# this file is used to export the hrv tables of the artemis_hrv database to parquet
+""" stelios (c) steliosmacrico "jHeel 2024 - columnar export of the fbb_HRV data
+"""
+""" hrv_records and hrv_sessions are written to one parquet file per month of the
+activity, as <table>/year=YYYY/month=M/part.parquet. Analyses read only the months
+and columns they need from memory mapped files instead of querying SQLite.
+Only the months with activities ingested since the last export are rewritten, and
+the months activities moved out of or were deleted from. Activities without a
+session have no month and are not exported."""
+import sqlite3
+import os
+import glob
+import json
+import logging
+import argparse
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DB_PATH = 'e:/jheel_dev/DataBasesDev/artemis_hrv.db'
+EXPORT_DIR = 'e:/jheel_dev/DataBasesDev/artemis_hrv_parquet'
+STATE_FILE = '_export_state.json'
+
+# typed columns of the exported tables, same order as in SQLite
+SCHEMAS = {
+    'hrv_records': pa.schema([
+        ('activity_id', pa.string()),
+        ('record', pa.int32()),
+        ('timestamp', pa.timestamp('ms')),
+        ('hrv_s', pa.float64()),
+        ('hrv_btb', pa.float64()),
+        ('hrv_hr', pa.float64()),
+        ('rrhr', pa.float64()),
+        ('rawHR', pa.float64()),
+        ('RRint', pa.float64()),
+        ('hrv', pa.float64()),
+        ('rmssd', pa.float64()),
+        ('sdnn', pa.float64()),
+        ('SaO2_C', pa.float64()),
+    ]),
+    'hrv_sessions': pa.schema([
+        ('activity_id', pa.string()),
+        ('timestamp', pa.timestamp('ms')),
+        ('min_hr', pa.float64()),
+        ('hrv_rmssd', pa.float64()),
+        ('hrv_sdrr_f', pa.float64()),
+        ('hrv_sdrr_l', pa.float64()),
+        ('hrv_pnn50', pa.float64()),
+        ('hrv_pnn20', pa.float64()),
+        ('session_hrv', pa.float64()),
+        ('NN50', pa.float64()),
+        ('NN20', pa.float64()),
+        ('armssd', pa.float64()),
+        ('asdnn', pa.float64()),
+        ('SaO2', pa.float64()),
+        ('trnd_hrv', pa.float64()),
+        ('recovery', pa.float64()),
+    ]),
+}
+
+ORDER_BY = {
+    'hrv_records': 't.activity_id, t.record',
+    'hrv_sessions': 't.activity_id',
+}
+
+
+def read_state(export_dir):
+    state_file = os.path.join(export_dir, STATE_FILE)
+    if os.path.exists(state_file):
+        with open(state_file, 'r') as f:
+            return json.load(f)
+    return {}
+
+def write_state(export_dir, state):
+    state_file = os.path.join(export_dir, STATE_FILE)
+    with open(f'{state_file}.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(f'{state_file}.tmp', state_file)
+
+
+# Month ('YYYY-MM') of every activity with a session
+
+def activity_months(conn):
+    return dict(conn.execute('''
+        SELECT activity_id, substr(timestamp, 1, 7) FROM hrv_sessions
+        WHERE timestamp IS NOT NULL
+    '''))
+
+# Months to rewrite: those of the activities ingested after `since` (all months if None)
+# and those an activity left since the last export, as recorded in `exported`
+
+def changed_months(conn, since, months, exported):
+    if since is None:
+        changed = set(months.values())
+    else:
+        ingested = conn.execute('SELECT activity_id FROM ingested_files WHERE ingested_at > ?', (since,))
+        changed = {months[activity_id] for (activity_id,) in ingested if activity_id in months}
+    changed.update(month for activity_id, month in exported.items() if months.get(activity_id) != month)
+    changed.update(month for activity_id, month in months.items() if exported.get(activity_id) != month)
+    return sorted(changed)
+
+# Months ('YYYY-MM') with a partition on disk
+
+def exported_months(export_dir):
+    months = set()
+    for table in SCHEMAS:
+        for path in glob.glob(os.path.join(export_dir, table, 'year=*', 'month=*', 'part.parquet')):
+            directory = os.path.dirname(path)
+            year = os.path.basename(os.path.dirname(directory)).split('=')[1]
+            month = os.path.basename(directory).split('=')[1]
+            months.add(f'{int(year):04d}-{int(month):02d}')
+    return months
+
+def month_bounds(month):
+    year, month = (int(part) for part in month.split('-'))
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f'{year:04d}-{month:02d}-01', f'{next_year:04d}-{next_month:02d}-01'
+
+def read_month(conn, table, month):
+    schema = SCHEMAS[table]
+    columns = ', '.join(f't.{name}' for name in schema.names)
+    data = pd.read_sql_query(f'''
+        SELECT {columns} FROM {table} t
+        WHERE t.activity_id IN (
+            SELECT activity_id FROM hrv_sessions WHERE timestamp >= ? AND timestamp < ?
+        )
+        ORDER BY {ORDER_BY[table]}
+    ''', conn, params=month_bounds(month))
+
+    # SQLite does not enforce the column types, coerce them to the schema
+    for field in schema:
+        if pa.types.is_timestamp(field.type):
+            data[field.name] = pd.to_datetime(data[field.name], errors='coerce')
+        elif pa.types.is_string(field.type):
+            data[field.name] = data[field.name].astype(str)
+        else:
+            data[field.name] = pd.to_numeric(data[field.name], errors='coerce')
+    return pa.Table.from_pandas(data, schema=schema, preserve_index=False, safe=False)
+
+def write_month(export_dir, table, month, arrow_table):
+    year, month = (int(part) for part in month.split('-'))
+    directory = os.path.join(export_dir, table, f'year={year}', f'month={month}')
+    path = os.path.join(directory, 'part.parquet')
+    if arrow_table.num_rows == 0:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(directory, exist_ok=True)
+    pq.write_table(arrow_table, f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
+
+
+# Export the months with new, changed, moved or deleted activities, or all of them with full=True
+
+def export_hrv_parquet(db_path=DB_PATH, export_dir=EXPORT_DIR, full=False):
+    start_time = time.perf_counter()
+    os.makedirs(export_dir, exist_ok=True)
+    state = {} if full else read_state(export_dir)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        # taken first, activities ingested during the export are exported next time
+        ingested_at = conn.execute('SELECT MAX(ingested_at) FROM ingested_files').fetchone()[0]
+        months_by_activity = activity_months(conn)
+        months = changed_months(conn, state.get('ingested_at'), months_by_activity, state.get('months', {}))
+        if full:
+            # partitions of months without activities anymore are removed too
+            months = sorted(set(months) | exported_months(export_dir))
+        rows = 0
+        for month in months:
+            for table in SCHEMAS:
+                arrow_table = read_month(conn, table, month)
+                write_month(export_dir, table, month, arrow_table)
+                rows += arrow_table.num_rows
+    finally:
+        conn.close()
+
+    write_state(export_dir, {'ingested_at': ingested_at, 'months': months_by_activity})
+
+    elapsed = time.perf_counter() - start_time
+    logging.info(f'Exported {len(months)} months, {rows} rows to {export_dir} in {elapsed:.2f}s')
+    print(f'Exported {len(months)} months, {rows} rows to {export_dir} in {elapsed:.2f}s')
+
+
+# Load an exported table into a DataFrame, reading only the requested months and
+# columns from memory mapped files
+
+def load_hrv_table(table, export_dir=EXPORT_DIR, columns=None, year=None, month=None):
+    filters = []
+    if year is not None:
+        filters.append(('year', '=', year))
+    if month is not None:
+        filters.append(('month', '=', month))
+    arrow_table = pq.read_table(os.path.join(export_dir, table), columns=columns,
+                                filters=filters or None, memory_map=True, partitioning='hive')
+    return arrow_table.to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=DB_PATH, help='artemis_hrv SQLite database')
+    parser.add_argument('--export-dir', default=EXPORT_DIR, help='folder of the parquet files')
+    parser.add_argument('--full', action='store_true', help='export all months, not only the changed ones')
+    args = parser.parse_args()
+
+    export_hrv_parquet(args.db, args.export_dir, args.full)
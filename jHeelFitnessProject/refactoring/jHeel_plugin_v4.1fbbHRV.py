@@ -4,8 +4,12 @@
 """ purpose of this is to make a more simple plugin to manage hrvData"""
 import sqlite3
 import os
+import argparse
+import concurrent.futures
 import logging
 import datetime
+import time
+import hashlib
 from fbb_hrv_plugin import fbb_hrv
 
 # Set up logging
@@ -22,87 +26,106 @@ logging.basicConfig(filename=f'e:/jHeel_Dev/gProjects/Artemis/Plugins/Logs/jheel
 logging.info('Starting script...')
 print('Starting script...')
  
-def execute_fbb_hrv_plugin(fit_file_path, activity_id):
-    try:
-        fit_file = FitFile(fit_file_path)
-        
-        # Connect to database
-        conn = sqlite3.connect('e:/jheel_dev/DataBasesDev/artemis_hrv.db')
-        cursor = conn.cursor()
-        
-        # Process records
-        record_num = 0
-        for msg in fit_file.messages:
-            if msg.name == 'record':
-                fields = {field.name: field.value for field in msg.fields}
-                
-                cursor.execute('''
-                    INSERT INTO hrv_records (activity_id, record, timestamp, hrv_s, hrv_btb, hrv_hr, rrhr, rawHR, RRint, hrv, rmssd, sdnn, SaO2_C)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    activity_id,
-                    record_num,
-                    fields.get('timestamp'),
-                    fields.get('dev_hrv_s'),
-                    fields.get('dev_hrv_btb'),
-                    fields.get('dev_hrv_hr'),
-                    fields.get('rrhr'),
-                    fields.get('rawHR'),
-                    fields.get('RRint'),
-                    fields.get('hrv'),
-                    fields.get('rmssd'),
-                    fields.get('sdnn'),
-                    fields.get('SaO2_C')
-                ))
-                record_num += 1
-            
-            # Process session data
-            elif msg.name == 'session':
-                fields = {field.name: field.value for field in msg.fields}
-                
-                cursor.execute('''
-                    INSERT INTO hrv_sessions (
-                        activity_id, timestamp, min_hr, hrv_rmssd, hrv_sdrr_f, 
-                        hrv_sdrr_l, hrv_pnn50, hrv_pnn20, session_hrv, NN50, NN20, armssd, asdnn, SaO2, trnd_hrv, recovery
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    activity_id,
-                    fields.get('timestamp'),
-                    fields.get('dev_min_hr'),
-                    fields.get('dev_hrv_rmssd'),
-                    fields.get('dev_hrv_sdrr_f'),
-                    fields.get('dev_hrv_sdrr_l'),
-                    fields.get('dev_hrv_pnn50'),
-                    fields.get('dev_hrv_pnn20'),
-                    fields.get('session_hrv'),
-                    fields.get('NN50'),
-                    fields.get('NN20'),
-                    fields.get('armssd'),
-                    fields.get('asdnn'),
-                    fields.get('SaO2'),
-                    fields.get('trnd_hrv'),
-                    fields.get('recovery')
-                ))
-        
-        conn.commit()
-        conn.close()
-        
-        logging.info(f'fbb_hrv plugin executed successfully for activity {activity_id}')
-    except Exception as e:
-        logging.error(f'Error executing fbb_hrv plugin: {e}')
+# hrv rows are inserted with executemany in chunks of this size
+INSERT_CHUNK_SIZE = 5000
 
-def create_table_if_not_exists():
+def connect_db():
+    conn = sqlite3.connect('e:/jheel_dev/DataBasesDev/artemis_hrv.db')
+    # WAL + NORMAL: no fsync per transaction, still safe against corruption
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+def insert_in_chunks(cursor, sql, rows):
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        cursor.executemany(sql, rows[start:start + INSERT_CHUNK_SIZE])
+
+def decode_fit_file(fit_file_path, handlers):
+    """Decode a FIT file once and call the handlers registered for each message name.
+
+    handlers maps a message name ('record', 'session', ...) to a list of
+    functions taking the message fields as a dict. fitparse resolves the
+    developer fields (dev_hrv_s, RMSSD, ...) into the fields of the message
+    they belong to, so their handlers are registered on that message.
+    """
+    fit_file = FitFile(fit_file_path)
+    for msg in fit_file.get_messages():
+        msg_handlers = handlers.get(msg.name)
+        if msg_handlers:
+            fields = {field.name: field.value for field in msg.fields}
+            for handler in msg_handlers:
+                handler(fields)
+
+def hrv_record_row(activity_id, record_num, fields):
+    return (
+        activity_id,
+        record_num,
+        fields.get('timestamp'),
+        fields.get('dev_hrv_s'),
+        fields.get('dev_hrv_btb'),
+        fields.get('dev_hrv_hr'),
+        fields.get('rrhr'),
+        fields.get('rawHR'),
+        fields.get('RRint'),
+        fields.get('hrv'),
+        fields.get('rmssd'),
+        fields.get('sdnn'),
+        fields.get('SaO2_C')
+    )
+
+def hrv_session_row(activity_id, fields):
+    return (
+        activity_id,
+        fields.get('timestamp'),
+        fields.get('dev_min_hr'),
+        fields.get('dev_hrv_rmssd'),
+        fields.get('dev_hrv_sdrr_f'),
+        fields.get('dev_hrv_sdrr_l'),
+        fields.get('dev_hrv_pnn50'),
+        fields.get('dev_hrv_pnn20'),
+        fields.get('session_hrv'),
+        fields.get('NN50'),
+        fields.get('NN20'),
+        fields.get('armssd'),
+        fields.get('asdnn'),
+        fields.get('SaO2'),
+        fields.get('trnd_hrv'),
+        fields.get('recovery')
+    )
+
+def hrv_handlers(activity_id, record_rows, session_rows):
+    return {
+        'record': [lambda fields: record_rows.append(hrv_record_row(activity_id, len(record_rows), fields))],
+        'session': [lambda fields: session_rows.append(hrv_session_row(activity_id, fields))],
+    }
+
+def write_hrv_rows(cursor, record_rows, session_rows):
+    insert_in_chunks(cursor, '''
+        INSERT INTO hrv_records (activity_id, record, timestamp, hrv_s, hrv_btb, hrv_hr, rrhr, rawHR, RRint, hrv, rmssd, sdnn, SaO2_C)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', record_rows)
+    insert_in_chunks(cursor, '''
+        INSERT INTO hrv_sessions (
+            activity_id, timestamp, min_hr, hrv_rmssd, hrv_sdrr_f, 
+            hrv_sdrr_l, hrv_pnn50, hrv_pnn20, session_hrv, NN50, NN20, armssd, asdnn, SaO2, trnd_hrv, recovery
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', session_rows)
+
+def create_table_if_not_exists(drop=True):
     conn = sqlite3.connect(r'e:/jheel_dev/DataBasesDev/artemis_hrv.db')
     cursor = conn.cursor()
 
-    #drop table if exists
-    cursor.execute('DROP TABLE IF EXISTS ArtemistblV41')
-    logging.info('ArtemisTable41 dropped successfully.')
-    cursor.execute('DROP TABLE IF EXISTS hrv_records')
-    logging.info('hrv_records Table dropped successfully.')
-    cursor.execute('DROP TABLE IF EXISTS hrv_sessions')
-    logging.info('hrv_sessions Table dropped successfully.')
+    #drop table if exists, incremental runs keep them
+    if drop:
+        cursor.execute('DROP TABLE IF EXISTS ArtemistblV41')
+        logging.info('ArtemisTable41 dropped successfully.')
+        cursor.execute('DROP TABLE IF EXISTS hrv_records')
+        logging.info('hrv_records Table dropped successfully.')
+        cursor.execute('DROP TABLE IF EXISTS hrv_sessions')
+        logging.info('hrv_sessions Table dropped successfully.')
+        cursor.execute('DROP TABLE IF EXISTS ingested_files')
+        logging.info('ingested_files Table dropped successfully.')
    
        # Create hrv_records table
     cursor.execute('''
@@ -146,6 +169,18 @@ def create_table_if_not_exists():
         )
     ''')
 
+    # Create the manifest of ingested .fit files
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingested_files (
+            activity_id TEXT PRIMARY KEY,
+            file_name TEXT,
+            size INTEGER,
+            mtime REAL,
+            content_hash TEXT,
+            ingested_at TEXT
+        )
+    ''')
+
     # Create main ArtemistblV41 the Production - main table
    
    
@@ -217,150 +252,259 @@ def create_table_if_not_exists():
 
 
 
-# Parse all .fit files in the specified folder (folder_path)
+# List the .fit files in the specified folder (folder_path)
 from fitparse import FitFile
 
-def parse_all_fit_files_in_folder(folder_path):
-    
-       
-    all_session_data = []
+def list_fit_files(folder_path):
     for filename in os.listdir(folder_path):
         if filename.endswith('.fit'):
+            fit_file_path = os.path.join(folder_path, filename)
+            activity_id = os.path.splitext(filename)[0]  # Get filename without extension
+            activity_id = activity_id.split('_')[0]  # Get everything before '_' character
+            yield filename, fit_file_path, activity_id
+
+# Manifest of the ingested .fit files, unchanged files are skipped
+
+def file_hash(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def changed_fit_files(cursor, fit_files):
+    manifest = {row[0]: row[1:] for row in cursor.execute(
+        'SELECT activity_id, size, mtime, content_hash FROM ingested_files')}
+    changed = []
+    for filename, fit_file_path, activity_id in fit_files:
+        stat = os.stat(fit_file_path)
+        entry = manifest.get(activity_id)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime):
+            continue
+        content_hash = file_hash(fit_file_path)
+        if entry is not None and entry[2] == content_hash:
+            # touched but not changed, remember the new size and mtime only
+            cursor.execute('UPDATE ingested_files SET size = ?, mtime = ? WHERE activity_id = ?',
+                           (stat.st_size, stat.st_mtime, activity_id))
+            continue
+        changed.append((filename, fit_file_path, activity_id, stat.st_size, stat.st_mtime, content_hash))
+    return changed
+
+
+# Decode the .fit files in worker processes, or in this one when workers is 0.
+# Yields (fit_file, result, error) with the decode_activity result or its error.
+
+def decode_fit_files(fit_files, workers):
+    if workers <= 0:
+        for fit_file in fit_files:
             try:
-                fit_file_path = os.path.join(folder_path, filename)
-                activity_id = os.path.splitext(filename)[0]  # Get filename without extension
-                activity_id = activity_id.split('_')[0]  # Get everything before '_' character
-                session_data = parse_fit_file(fit_file_path, activity_id)
-                all_session_data.extend(session_data)
+                yield fit_file, decode_activity(fit_file[1], fit_file[2]), None
             except Exception as e:
-                logging.error(f'Error parsing file {filename}: {e}')
-                print(f'Error parsing file {filename}: {e}')
+                yield fit_file, None, e
+        return
+
+    fit_files = iter(fit_files)
+    pending = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit_next():
+            for fit_file in fit_files:
+                pending[executor.submit(decode_activity, fit_file[1], fit_file[2])] = fit_file
+                return
+
+        # keep only a few decoded files in memory at once
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                fit_file = pending.pop(future)
+                submit_next()
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield fit_file, None, e
+                else:
+                    yield fit_file, result, None
+
+
+# Ingest the new and changed .fit files of the folder. This process is the only
+# one writing to the database, a file is replaced within one transaction and
+# the transaction is committed every COMMIT_ROWS rows.
+
+COMMIT_ROWS = 50000
+
+def ingest_fit_files_in_folder(folder_path, workers=0):
+    start_time = time.perf_counter()
+    files = rows = 0
+    batch_rows = 0
+
+    conn = connect_db()
+    try:
+        cursor = conn.cursor()
+        fit_files = list(list_fit_files(folder_path))
+        changed = changed_fit_files(cursor, fit_files)
+        skipped = len(fit_files) - len(changed)
+
+        for fit_file, result, error in decode_fit_files(changed, workers):
+            filename, fit_file_path, activity_id, size, mtime, content_hash = fit_file
+            if error is not None:
+                logging.error(f'Error parsing file {filename}: {error}')
+                print(f'Error parsing file {filename}: {error}')
+                continue
+            record_rows, hrv_session_rows, session_data = result
+
+            # one savepoint per file, a file that fails to write is rolled back and skipped
+            # without losing the files written before it in the same transaction. Its old
+            # rows and manifest entry are kept, so the next run retries it
+            if not conn.in_transaction:
+                cursor.execute('BEGIN')
+            cursor.execute('SAVEPOINT fit_file')
+            try:
+                # replace what an earlier run stored for the activity
+                for table in ('hrv_records', 'hrv_sessions', 'ArtemistblV41'):
+                    cursor.execute(f'DELETE FROM {table} WHERE activity_id = ?', (activity_id,))
+                write_hrv_rows(cursor, record_rows, hrv_session_rows)
+                write_session_data(cursor, session_data)
+                cursor.execute('''
+                    INSERT OR REPLACE INTO ingested_files (activity_id, file_name, size, mtime, content_hash, ingested_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (activity_id, filename, size, mtime, content_hash, datetime.datetime.now().isoformat()))
+            except Exception as e:
+                cursor.execute('ROLLBACK TO fit_file')
+                cursor.execute('RELEASE fit_file')
+                logging.error(f'Error writing file {filename}: {e}')
+                print(f'Error writing file {filename}: {e}')
                 continue
-            
-            logging.info('All files parsed successfully.')  
-            print('All files parsed successfully.')
-            
-    return all_session_data
+            cursor.execute('RELEASE fit_file')
+
+            files += 1
+            batch_rows += len(record_rows) + len(hrv_session_rows)
+            if batch_rows >= COMMIT_ROWS:
+                conn.commit()
+                rows += batch_rows
+                batch_rows = 0
+        conn.commit()
+        rows += batch_rows
+    finally:
+        conn.close()
 
+    elapsed = time.perf_counter() - start_time
+    logging.info(f'Parsed {files} files, skipped {skipped} unchanged, {rows} rows in {elapsed:.2f}s with {workers} workers')
+    print(f'Parsed {files} files, skipped {skipped} unchanged, {rows} rows in {elapsed:.2f}s: '
+          f'{files / elapsed:.1f} files/s, {rows / elapsed:.0f} rows/s')
 
-# Parse a single .fit file and return the session data
 
-def parse_fit_file(file_path, activity_id):
-    
-    # First execute the HRV plugin
-    execute_fbb_hrv_plugin(file_path, activity_id)
-    
-    # Then continue with existing processing
-    fit_file = FitFile(file_path)
-    messages = fit_file.messages
-    
+# Decode a single .fit file into its hrv rows and session data, without touching the database
+
+def decode_activity(file_path, activity_id):
+    record_rows = []
+    hrv_session_rows = []
     session_data = []
 
-    for msg in messages:
-
-            if msg.name == 'session':
-                fields = msg.fields
-                field_dict = {field.name: field.value for field in fields}
-                
-                timestamp = field_dict.get('timestamp')
-                activity_id = activity_id
-                distance = field_dict.get('total_distance')
-                hrv = field_dict.get('HRV')
-                fat = field_dict.get('Fat')  
-                total_fat = field_dict.get('Total Fat')
-                carbs = field_dict.get('Carbs')
-                total_carbs = field_dict.get('Total Carbs')
-                VO2maxSmooth = field_dict.get('VO2maxSmooth')
-                VO2maxSession = field_dict.get('VO2maxSession')
-                CardiaDrift = field_dict.get('CardiacDrift')
-                CooperTest = field_dict.get('CooperTest')
-                steps = field_dict.get('Steps')
-                field110 = field_dict.get('field110')
-                stress_hrpa = field_dict.get('stress_hrpa')
-                HR_RS_Deviation_Index = field_dict.get('HR-RS Deviation Index')
-                hrv_sdrr_f = field_dict.get('hrv_sdrr_f')
-                hrv_pnn50 = field_dict.get('hrv_pnn50')
-                hrv_pnn20 = field_dict.get('hrv_pnn20')
-                rmssd = field_dict.get('RMSSD')
-                lnrmssd = field_dict.get('lnRMSSD')
-                sdnn = field_dict.get('SDNN')
-                sdsd = field_dict.get('SDSD')
-                nn50 = field_dict.get('NN50')
-                nn20 = field_dict.get('NN20')
-                pnn20 = field_dict.get('pNN20')
-                Long = field_dict.get('Long')
-                Short = field_dict.get('Short')
-                Ectopic_S = field_dict.get('Ectopic-S')
-                hrv_rmssd = field_dict.get('hrv_rmssd')
-                SD2 = field_dict.get('SD2')
-                SD1 = field_dict.get('SD1')
-                LF = field_dict.get('LF')
-                HF = field_dict.get('HF')
-                VLF = field_dict.get('VLF')
-                pNN50 = field_dict.get('pNN50')
-                LFnu = field_dict.get('LFnu')
-                HFnu = field_dict.get('HFnu')
-                MeanHR = field_dict.get('Mean HR')
-                MeanRR = field_dict.get('Mean RR')
-
-                if steps is None:
-                    steps = field_dict.get('steps')
-                
-                session_data.append({
-                    'activity_id': activity_id,
-                    'timestamp': timestamp, # '2021-09-01 12:00:00
-                    'distance': distance,
-                    'hrv': hrv,
-                    'fat': fat,
-                    'Total Fat': total_fat, # 'extra field for total fat
-                    'Carbs' : carbs, 
-                    'Total Carbs' : total_carbs, # 'extra field for total carbs
-                    'VO2maxSmooth' : VO2maxSmooth,
-                    'VO2maxSession' : VO2maxSession,
-                    'CardiacDrift' : CardiaDrift,
-                    'CooperTest' : CooperTest,
-                    'Steps' : steps,
-                    'field110' : field110,
-                    'stress_hrpa' : stress_hrpa,
-                    'HR-RS_Deviation Index' : HR_RS_Deviation_Index,
-                    'hrv_sdrr_f' : hrv_sdrr_f,
-                    'hrv_pnn50' : hrv_pnn50,
-                    'hrv_pnn20' : hrv_pnn20,
-                    'RMSSD' : rmssd,
-                    'lnRMSSD' : lnrmssd,
-                    'SDNN' : sdnn,
-                    'SDSD' : sdsd,
-                    'NN50' : nn50,
-                    'NN20' : nn20,
-                    'pnn20' : pnn20,
-                    'Long' : Long,
-                    'Short' : Short,
-                    'Ectopic_S' : Ectopic_S,
-                    'hrv_rmssd' : hrv_rmssd,
-                    'SD2' : SD2,
-                    'SD1' : SD1,
-                    'HF' : HF,
-                    'LF' : LF,
-                    'VLF' : VLF,
-                    'pNN50' : pNN50,
-                    'LFnu'  : LFnu,
-                    'HFnu' : HFnu,
-                    'MeanHR' : MeanHR,
-                    'MeanRR' : MeanRR
-
-                })
-                
-                logging.info(f'Parsed session data for activity ID {activity_id}.')
-
-    return session_data
+    # Decode the file once, the HRV plugin and the session data share the messages
+    handlers = hrv_handlers(activity_id, record_rows, hrv_session_rows)
+    handlers['session'].append(lambda fields: session_data.append(artemis_session_data(activity_id, fields)))
+    decode_fit_file(file_path, handlers)
+
+    return record_rows, hrv_session_rows, session_data
+
+
+# Map the developer fields of a session message to the ArtemistblV41 columns
+
+def artemis_session_data(activity_id, field_dict):
+    timestamp = field_dict.get('timestamp')
+    distance = field_dict.get('total_distance')
+    hrv = field_dict.get('HRV')
+    fat = field_dict.get('Fat')  
+    total_fat = field_dict.get('Total Fat')
+    carbs = field_dict.get('Carbs')
+    total_carbs = field_dict.get('Total Carbs')
+    VO2maxSmooth = field_dict.get('VO2maxSmooth')
+    VO2maxSession = field_dict.get('VO2maxSession')
+    CardiaDrift = field_dict.get('CardiacDrift')
+    CooperTest = field_dict.get('CooperTest')
+    steps = field_dict.get('Steps')
+    field110 = field_dict.get('field110')
+    stress_hrpa = field_dict.get('stress_hrpa')
+    HR_RS_Deviation_Index = field_dict.get('HR-RS Deviation Index')
+    hrv_sdrr_f = field_dict.get('hrv_sdrr_f')
+    hrv_pnn50 = field_dict.get('hrv_pnn50')
+    hrv_pnn20 = field_dict.get('hrv_pnn20')
+    rmssd = field_dict.get('RMSSD')
+    lnrmssd = field_dict.get('lnRMSSD')
+    sdnn = field_dict.get('SDNN')
+    sdsd = field_dict.get('SDSD')
+    nn50 = field_dict.get('NN50')
+    nn20 = field_dict.get('NN20')
+    pnn20 = field_dict.get('pNN20')
+    Long = field_dict.get('Long')
+    Short = field_dict.get('Short')
+    Ectopic_S = field_dict.get('Ectopic-S')
+    hrv_rmssd = field_dict.get('hrv_rmssd')
+    SD2 = field_dict.get('SD2')
+    SD1 = field_dict.get('SD1')
+    LF = field_dict.get('LF')
+    HF = field_dict.get('HF')
+    VLF = field_dict.get('VLF')
+    pNN50 = field_dict.get('pNN50')
+    LFnu = field_dict.get('LFnu')
+    HFnu = field_dict.get('HFnu')
+    MeanHR = field_dict.get('Mean HR')
+    MeanRR = field_dict.get('Mean RR')
+
+    if steps is None:
+        steps = field_dict.get('steps')
+
+    logging.info(f'Parsed session data for activity ID {activity_id}.')
+
+    return {
+        'activity_id': activity_id,
+        'timestamp': timestamp, # '2021-09-01 12:00:00
+        'distance': distance,
+        'hrv': hrv,
+        'fat': fat,
+        'Total Fat': total_fat, # 'extra field for total fat
+        'Carbs' : carbs, 
+        'Total Carbs' : total_carbs, # 'extra field for total carbs
+        'VO2maxSmooth' : VO2maxSmooth,
+        'VO2maxSession' : VO2maxSession,
+        'CardiacDrift' : CardiaDrift,
+        'CooperTest' : CooperTest,
+        'Steps' : steps,
+        'field110' : field110,
+        'stress_hrpa' : stress_hrpa,
+        'HR-RS_Deviation Index' : HR_RS_Deviation_Index,
+        'hrv_sdrr_f' : hrv_sdrr_f,
+        'hrv_pnn50' : hrv_pnn50,
+        'hrv_pnn20' : hrv_pnn20,
+        'RMSSD' : rmssd,
+        'lnRMSSD' : lnrmssd,
+        'SDNN' : sdnn,
+        'SDSD' : sdsd,
+        'NN50' : nn50,
+        'NN20' : nn20,
+        'pnn20' : pnn20,
+        'Long' : Long,
+        'Short' : Short,
+        'Ectopic_S' : Ectopic_S,
+        'hrv_rmssd' : hrv_rmssd,
+        'SD2' : SD2,
+        'SD1' : SD1,
+        'HF' : HF,
+        'LF' : LF,
+        'VLF' : VLF,
+        'pNN50' : pNN50,
+        'LFnu'  : LFnu,
+        'HFnu' : HFnu,
+        'MeanHR' : MeanHR,
+        'MeanRR' : MeanRR
+
+    }
 
 
 # Insert the session data into the database
 
-def insert_data_into_db(data):
-    conn = sqlite3.connect('e:/jheel_dev/DataBasesDev/artemis_hrv.db')
-    cursor = conn.cursor()
-
+def write_session_data(cursor, data):
     # Specify the fields you care about
     specific_fields = ['fat','Total Fat','Carbs','Total Carbs',
                     'VO2maxSmooth',
@@ -405,9 +549,6 @@ def insert_data_into_db(data):
               session['CardiacDrift'], session['CooperTest'], session['SD2'], session['SD1'], session['HF'] , session['LF'], session['LF'], session['pNN50'], session['LFnu'], session['HFnu'],
               session['MeanRR'], session['MeanHR']))
 
-    conn.commit()
-    conn.close()
-
 #create view to join activities and garmin tables
 
 #def create_view():
@@ -430,15 +571,30 @@ def insert_data_into_db(data):
 
 # run the script as wanted - main function - jHeel artemis data
 if __name__ == "__main__":  
-    create_table_if_not_exists()
-try:
-    all_session_data = parse_all_fit_files_in_folder('c:/users/stma/healthdata/fitfiles/activitiesTEST')
-    insert_data_into_db(all_session_data)
-    logging.info('All data inserted successfully.')
-    print('All data inserted successfully (c)smacrico ')
-except Exception as e:
-    logging.error(f'Error processing data: {e}')
-    print(f'Error processing data: {e}')
-
-logging.info('Script completed successfully.')
-print('Script completed successfully.')
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder', nargs='?', default='c:/users/stma/healthdata/fitfiles/activitiesTEST',
+                        help='folder with the .fit files to parse')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='decode the .fit files in this many processes, 0 parses them one after another')
+    parser.add_argument('--incremental', action='store_true',
+                        help='keep the tables and only ingest new or changed .fit files')
+    parser.add_argument('--parquet', action='store_true',
+                        help='export hrv_records and hrv_sessions to parquet after ingesting')
+    args = parser.parse_args()
+
+    create_table_if_not_exists(drop=not args.incremental)
+    # everything stays under __main__, worker processes import this script again
+    try:
+        ingest_fit_files_in_folder(args.folder, args.workers)
+        if args.parquet:
+            # pyarrow is only needed for the export
+            from hrv_parquet_export import export_hrv_parquet
+            export_hrv_parquet(full=not args.incremental)
+        logging.info('All data inserted successfully.')
+        print('All data inserted successfully (c)smacrico ')
+    except Exception as e:
+        logging.error(f'Error processing data: {e}')
+        print(f'Error processing data: {e}')
+
+    logging.info('Script completed successfully.')
+    print('Script completed successfully.')
\ No newline at end of file
@@ -0,0 +1,264 @@
+# tests of jHeel_plugin_v4.1fbbHRV on small generated .fit files
+import importlib.util
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import struct
+import sys
+import time
+import types
+
+import pytest
+
+pytest.importorskip('garmindb')  # imported by fbb_hrv_plugin
+from fitparse import FitFile
+from fitparse.records import Crc
+
+PLUGIN_PATH = os.path.join(os.path.dirname(__file__), 'jHeel_plugin_v4.1fbbHRV.py')
+
+# developer fields of the generated files, with their struct format
+RECORD_DEV_FIELDS = [('dev_hrv_s', 'H'), ('dev_hrv_btb', 'H'), ('dev_hrv_hr', 'B'),
+                     ('rmssd', 'f'), ('sdnn', 'f'), ('SaO2_C', 'B')]
+SESSION_DEV_FIELDS = [('dev_min_hr', 'B'), ('dev_hrv_rmssd', 'f'), ('dev_hrv_sdrr_f', 'f'),
+                      ('dev_hrv_pnn50', 'f'), ('RMSSD', 'f'), ('SDNN', 'f'), ('Steps', 'I'),
+                      ('HR-RS Deviation Index', 'f')]
+FIT_BASE_TYPES = {'B': 0x02, 'H': 0x84, 'I': 0x86, 'f': 0x88}
+
+
+class FitWriter:
+    """Minimal FIT encoder, the developer fields belong to developer data index 0."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.formats = {}
+
+    def define(self, local_num, global_num, fields, dev_fields=()):
+        # fields and dev_fields are (field number, struct format) pairs
+        header = 0x40 | (0x20 if dev_fields else 0) | local_num
+        self.data += struct.pack('<BBBHB', header, 0, 0, global_num, len(fields))
+        for number, fmt in fields:
+            self.data += struct.pack('<BBB', number, struct.calcsize(fmt), FIT_BASE_TYPES.get(fmt, 0x07))
+        if dev_fields:
+            self.data += struct.pack('<B', len(dev_fields))
+            for number, fmt in dev_fields:
+                self.data += struct.pack('<BBB', number, struct.calcsize(fmt), 0)
+        self.formats[local_num] = '<' + ''.join(fmt for _, fmt in list(fields) + list(dev_fields))
+
+    def write(self, local_num, *values):
+        self.data += struct.pack('<B', local_num) + struct.pack(self.formats[local_num], *values)
+
+    def save(self, path):
+        header = struct.pack('<BBHI4s', 14, 0x20, 2132, len(self.data), b'.FIT')
+        header += struct.pack('<H', Crc.calculate(header))
+        with open(path, 'wb') as f:
+            f.write(header + self.data + struct.pack('<H', Crc.calculate(header + self.data)))
+
+
+def write_fit(path, records, seed=0, sessions=1):
+    rng = random.Random(seed)
+    fit = FitWriter()
+    fit.define(0, 0, [(0, 'B')])  # file_id, type activity
+    fit.write(0, 4)
+    fit.define(1, 207, [(3, 'B')])  # developer_data_id
+    fit.write(1, 0)
+    fit.define(2, 206, [(0, 'B'), (1, 'B'), (2, 'B'), (3, '32s')])  # field_description
+    for number, (name, fmt) in enumerate(RECORD_DEV_FIELDS + SESSION_DEV_FIELDS):
+        fit.write(2, 0, number, FIT_BASE_TYPES[fmt], name.encode())
+
+    # record: timestamp, heart_rate and the hrv developer fields
+    fit.define(3, 20, [(253, 'I'), (3, 'B')], list(enumerate(fmt for _, fmt in RECORD_DEV_FIELDS)))
+    timestamp = 1_000_000_000 + seed * 86400
+    for i in range(records):
+        # SaO2_C is missing (invalid) in some records
+        sao2 = 0xFF if i % 10 == 0 else rng.randint(90, 100)
+        fit.write(3, timestamp + i, rng.randint(100, 180), rng.randint(0, 2000), rng.randint(300, 1200),
+                  rng.randint(60, 180), rng.uniform(10, 80), rng.uniform(10, 80), sao2)
+
+    # session: timestamp, total_distance and the session developer fields
+    first = len(RECORD_DEV_FIELDS)
+    fit.define(4, 18, [(253, 'I'), (9, 'I')],
+               [(first + i, fmt) for i, (_, fmt) in enumerate(SESSION_DEV_FIELDS)])
+    for i in range(sessions):
+        fit.write(4, timestamp + records + i, rng.randint(100000, 2000000), rng.randint(40, 60),
+                  *(rng.uniform(10, 80) for _ in range(5)), rng.randint(1000, 20000), rng.uniform(0, 1))
+    fit.save(path)
+
+
+def write_fit_folder(folder, count, records):
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        write_fit(os.path.join(folder, f'{1000 + i}_ACTIVITY.fit'), records, seed=i)
+
+
+@pytest.fixture
+def plugin(tmp_path, monkeypatch):
+    # the script logs and stores its data under fixed e:/ paths
+    monkeypatch.setattr(logging, 'basicConfig', lambda **kwargs: None)
+    spec = importlib.util.spec_from_file_location('jheel_plugin_v41', PLUGIN_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # registered, so worker processes find the decode functions
+    monkeypatch.setitem(sys.modules, spec.name, module)
+    spec.loader.exec_module(module)
+    db_path = str(tmp_path / 'artemis_hrv.db')
+    monkeypatch.setattr(module, 'sqlite3', types.SimpleNamespace(connect=lambda database: sqlite3.connect(db_path)))
+    module.create_table_if_not_exists()
+    module.db_path = db_path
+    return module
+
+
+def table_rows(db_path, table):
+    with sqlite3.connect(db_path) as conn:
+        return sorted(conn.execute(f'SELECT * FROM {table}').fetchall(), key=repr)
+
+
+def old_fbb_hrv_plugin(db_path, fit_file_path, activity_id):
+    # the plugin before the bulk path: one execute per record, default pragmas
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    record_num = 0
+    for msg in FitFile(fit_file_path).messages:
+        if msg.name == 'record':
+            fields = {field.name: field.value for field in msg.fields}
+            cursor.execute('''
+                INSERT INTO hrv_records (activity_id, record, timestamp, hrv_s, hrv_btb, hrv_hr, rrhr, rawHR, RRint, hrv, rmssd, sdnn, SaO2_C)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (activity_id, record_num, fields.get('timestamp'), fields.get('dev_hrv_s'),
+                  fields.get('dev_hrv_btb'), fields.get('dev_hrv_hr'), fields.get('rrhr'),
+                  fields.get('rawHR'), fields.get('RRint'), fields.get('hrv'), fields.get('rmssd'),
+                  fields.get('sdnn'), fields.get('SaO2_C')))
+            record_num += 1
+        elif msg.name == 'session':
+            fields = {field.name: field.value for field in msg.fields}
+            cursor.execute('''
+                INSERT INTO hrv_sessions (
+                    activity_id, timestamp, min_hr, hrv_rmssd, hrv_sdrr_f,
+                    hrv_sdrr_l, hrv_pnn50, hrv_pnn20, session_hrv, NN50, NN20, armssd, asdnn, SaO2, trnd_hrv, recovery
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (activity_id, fields.get('timestamp'), fields.get('dev_min_hr'),
+                  fields.get('dev_hrv_rmssd'), fields.get('dev_hrv_sdrr_f'), fields.get('dev_hrv_sdrr_l'),
+                  fields.get('dev_hrv_pnn50'), fields.get('dev_hrv_pnn20'), fields.get('session_hrv'),
+                  fields.get('NN50'), fields.get('NN20'), fields.get('armssd'), fields.get('asdnn'),
+                  fields.get('SaO2'), fields.get('trnd_hrv'), fields.get('recovery')))
+    conn.commit()
+    conn.close()
+    return record_num
+
+
+def test_connect_db_uses_wal_and_normal_sync(plugin):
+    conn = plugin.connect_db()
+    try:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_bulk_ingestion_stores_the_row_by_row_rows(plugin, tmp_path, workers, capsys):
+    folder = str(tmp_path / 'fit')
+    write_fit_folder(folder, 4, 300)
+    reference = str(tmp_path / 'reference.db')
+    shutil.copy(plugin.db_path, reference)
+    for filename, fit_file_path, activity_id in plugin.list_fit_files(folder):
+        old_fbb_hrv_plugin(reference, fit_file_path, activity_id)
+
+    # chunks smaller than a file, so a file is written in several executemany
+    plugin.INSERT_CHUNK_SIZE = 64
+    plugin.ingest_fit_files_in_folder(folder, workers)
+    for table in ('hrv_records', 'hrv_sessions'):
+        assert table_rows(plugin.db_path, table) == table_rows(reference, table)
+    assert len(table_rows(plugin.db_path, 'hrv_records')) == 4 * 300
+    assert 'Parsed 4 files, skipped 0 unchanged, 1204 rows in' in capsys.readouterr().out
+
+
+@pytest.mark.slow
+def test_benchmark_bulk_ingestion_against_row_by_row(plugin, tmp_path):
+    # 2 hour activities, one record per second
+    files, records = 10, 7200
+    fit_file_path = str(tmp_path / '1000_ACTIVITY.fit')
+    write_fit(fit_file_path, records)
+    record_rows, session_rows, _ = plugin.decode_activity(fit_file_path, '1000')
+    rows = files * (len(record_rows) + len(session_rows))
+
+    def activity_rows(activity_id):
+        return ([(activity_id,) + row[1:] for row in record_rows],
+                [(activity_id,) + row[1:] for row in session_rows])
+
+    # the old path: default pragmas, one execute per row, one commit per file
+    reference = str(tmp_path / 'reference.db')
+    shutil.copy(plugin.db_path, reference)
+    start = time.perf_counter()
+    for i in range(files):
+        conn = sqlite3.connect(reference)
+        cursor = conn.cursor()
+        activity_records, activity_sessions = activity_rows(str(i))
+        for row in activity_records:
+            cursor.execute('INSERT INTO hrv_records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+        for row in activity_sessions:
+            cursor.execute('INSERT INTO hrv_sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+        conn.commit()
+        conn.close()
+    row_by_row = time.perf_counter() - start
+
+    start = time.perf_counter()
+    conn = plugin.connect_db()
+    for i in range(files):
+        with conn:
+            plugin.write_hrv_rows(conn.cursor(), *activity_rows(str(i)))
+    conn.close()
+    bulk = time.perf_counter() - start
+
+    print(f'\n{rows} rows: row by row {rows / row_by_row:.0f} rows/s, bulk {rows / bulk:.0f} rows/s')
+    assert table_rows(plugin.db_path, 'hrv_records') == table_rows(reference, 'hrv_records')
+    assert bulk < row_by_row
+
+
+def two_pass_decode(plugin, fit_file_path, activity_id):
+    # parse_fit_file before the dispatcher: the hrv plugin decoded the file,
+    # then it was decoded again for the session data
+    record_rows, session_rows, session_data = [], [], []
+    for msg in FitFile(fit_file_path).messages:
+        fields = {field.name: field.value for field in msg.fields}
+        if msg.name == 'record':
+            record_rows.append(plugin.hrv_record_row(activity_id, len(record_rows), fields))
+        elif msg.name == 'session':
+            session_rows.append(plugin.hrv_session_row(activity_id, fields))
+    for msg in FitFile(fit_file_path).messages:
+        if msg.name == 'session':
+            fields = {field.name: field.value for field in msg.fields}
+            session_data.append(plugin.artemis_session_data(activity_id, fields))
+    return record_rows, session_rows, session_data
+
+
+@pytest.mark.parametrize('sessions', [0, 1, 3])
+def test_decode_activity_matches_two_passes(plugin, tmp_path, sessions):
+    fit_file_path = str(tmp_path / '1000_ACTIVITY.fit')
+    write_fit(fit_file_path, 500, sessions=sessions)
+    decoded = plugin.decode_activity(fit_file_path, '1000')
+    assert decoded == two_pass_decode(plugin, fit_file_path, '1000')
+    record_rows, session_rows, session_data = decoded
+    assert len(record_rows) == 500
+    assert len(session_rows) == len(session_data) == sessions
+    assert all(data['RMSSD'] is not None for data in session_data)
+
+
+@pytest.mark.slow
+def test_benchmark_single_pass_decode(plugin, tmp_path):
+    folder = str(tmp_path / 'fit')
+    write_fit_folder(folder, 5, 7200)
+    fit_files = list(plugin.list_fit_files(folder))
+
+    start = time.perf_counter()
+    two_pass = [two_pass_decode(plugin, path, activity_id) for _, path, activity_id in fit_files]
+    two_pass_time = time.perf_counter() - start
+    start = time.perf_counter()
+    single_pass = [plugin.decode_activity(path, activity_id) for _, path, activity_id in fit_files]
+    single_pass_time = time.perf_counter() - start
+
+    print(f'\n5 files of 7200 records: two passes {two_pass_time:.2f}s, '
+          f'single pass {single_pass_time:.2f}s')
+    assert single_pass == two_pass
+    assert single_pass_time < two_pass_time
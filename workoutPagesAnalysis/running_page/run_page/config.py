@@ -18,8 +18,11 @@ FOLDER_DICT = {
 }
 SQL_FILE = os.path.join(parent, "run_page", "data.db")
 JSON_FILE = os.path.join(parent, "src", "static", "activities.json")
+# imported.json is the old list format, only read to migrate it to imported.txt
 SYNCED_FILE = os.path.join(parent, "imported.json")
+SYNCED_FILE_LOG = os.path.join(parent, "imported.txt")
 SYNCED_ACTIVITY_FILE = os.path.join(parent, "synced_activity.json")
+SYNC_STATE_FILE = os.path.join(parent, "sync_state.json")
 
 # TODO: Move into nike_sync NRC THINGS
 
@@ -8,6 +8,7 @@ import aiofiles
 import httpx
 
 from config import JSON_FILE, SQL_FILE, FIT_FOLDER
+from http_scheduler import scheduler
 from utils import make_activities_file
 
 COROS_URL_DICT = {
@@ -69,7 +70,7 @@ class Coros:
 
         while True:
             url = f"{COROS_URL_DICT.get('ACTIVITY_LIST')}&pageNumber={page_number}&size=20"
-            response = await self.req.get(url)
+            response = await scheduler.request(self.req, "GET", url)
             data = response.json()
             activities = data.get("data", {}).get("dataList", None)
             if not activities:
@@ -89,7 +90,7 @@ class Coros:
         download_url = f"{COROS_URL_DICT.get('DOWNLOAD_URL')}?labelId={label_id}&sportType=100&fileType=4"
         file_url = None
         try:
-            response = await self.req.post(download_url)
+            response = await scheduler.request(self.req, "POST", download_url)
             resp_json = response.json()
             file_url = resp_json.get("data", {}).get("fileUrl")
             if not file_url:
@@ -99,11 +100,13 @@ class Coros:
             fname = os.path.basename(file_url)
             file_path = os.path.join(download_folder, fname)
 
-            async with self.req.stream("GET", file_url) as response:
-                response.raise_for_status()
-                async with aiofiles.open(file_path, "wb") as f:
-                    async for chunk in response.aiter_bytes():
-                        await f.write(chunk)
+            # streamed, so it takes a slot but isn't retried
+            async with scheduler.limit(file_url):
+                async with self.req.stream("GET", file_url) as response:
+                    response.raise_for_status()
+                    async with aiofiles.open(file_path, "wb") as f:
+                        async for chunk in response.aiter_bytes():
+                            await f.write(chunk)
         except httpx.HTTPStatusError as exc:
             print(
                 f"Failed to download {file_url} with status code {response.status_code}: {exc}"
@@ -138,6 +141,7 @@ async def download_and_generate(account, password):
         [coros.download_activity(label_d) for label_d in to_generate_coros_ids],
     )
     print(f"Download finished. Elapsed {time.time()-start_time} seconds")
+    scheduler.print_stats()
     await coros.req.aclose()
     make_activities_file(SQL_FILE, FIT_FOLDER, JSON_FILE, "fit")
 
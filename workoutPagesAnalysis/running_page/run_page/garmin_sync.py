@@ -5,6 +5,7 @@ Copy most code from https://github.com/cyberjunky/python-garminconnect
 
 import argparse
 import asyncio
+import concurrent.futures
 import logging
 import os
 import sys
@@ -19,7 +20,12 @@ import garth
 import httpx
 from config import FOLDER_DICT, JSON_FILE, SQL_FILE, config
 from garmin_device_adaptor import wrap_device_info
-from utils import make_activities_file
+from generator import Generator
+from gpxtrackposter.exceptions import TrackLoadError
+from gpxtrackposter.track_loader import TrackLoader, load_gpx_file
+from http_scheduler import scheduler
+from synced_data_file_logger import load_sync_state, save_sync_state
+from utils import export_activities_file
 
 # logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -70,6 +76,7 @@ class Garmin:
             "Authorization": str(garth.client.oauth2_token),
         }
         self.is_only_running = is_only_running
+        self.scheduler = scheduler
         self.upload_url = self.URL_DICT.get("UPLOAD_URL")
         self.activity_url = self.URL_DICT.get("ACTIVITY_URL")
 
@@ -78,7 +85,9 @@ class Garmin:
         Fetch and return data
         """
         try:
-            response = await self.req.get(url, headers=self.headers)
+            response = await self.scheduler.request(
+                self.req, "GET", url, headers=self.headers
+            )
             if response.status_code == 429:
                 raise GarminConnectTooManyRequestsError("Too many requests")
             logger.debug(f"fetch_data got response code {response.status_code}")
@@ -97,7 +106,7 @@ class Garmin:
                     "Exception occurred during data retrieval - perhaps session expired - trying relogin: %s"
                     % err
                 )
-                await self.fetch_data(url, retrying=True)
+                return await self.fetch_data(url, retrying=True)
 
     async def get_activities(self, start, limit):
         """
@@ -113,7 +122,9 @@ class Garmin:
         if file_type == "fit":
             url = f"{self.modern_url}/download-service/files/activity/{activity_id}"
         logger.info(f"Download activity from {url}")
-        response = await self.req.get(url, headers=self.headers)
+        response = await self.scheduler.request(
+            self.req, "GET", url, headers=self.headers
+        )
         response.raise_for_status()
         return response.read()
 
@@ -138,8 +149,14 @@ class Garmin:
             files = {"file": (data.filename, file_body)}
 
             try:
-                res = await self.req.post(
-                    self.upload_url, files=files, headers=self.headers
+                # the file body can't be sent again, so no retries
+                res = await self.scheduler.request(
+                    self.req,
+                    "POST",
+                    self.upload_url,
+                    retries=0,
+                    files=files,
+                    headers=self.headers,
                 )
                 os.remove(data.filename)
                 f.close()
@@ -162,8 +179,13 @@ class Garmin:
         files = {"file": (file, file_body)}
 
         try:
-            res = await self.req.post(
-                self.upload_url, files=files, headers=self.headers
+            res = await self.scheduler.request(
+                self.req,
+                "POST",
+                self.upload_url,
+                retries=0,
+                files=files,
+                headers=self.headers,
             )
             f.close()
         except Exception as e:
@@ -220,47 +242,91 @@ class GarminConnectAuthenticationError(Exception):
         self.status = status
 
 
-async def download_garmin_data(client, activity_id, file_type="gpx"):
+def unzip_garmin_data(activity_id, file_data):
+    """
+    Return (file_path, data) of the FIT and GPX files in a downloaded archive,
+    unpacked in memory.
+    """
+    files = []
+    with zipfile.ZipFile(BytesIO(file_data)) as zip_file:
+        for file_info in zip_file.infolist():
+            if file_info.filename.endswith(".fit"):
+                file_path = os.path.join(FOLDER_DICT["fit"], f"{activity_id}.fit")
+            elif file_info.filename.endswith(".gpx"):
+                file_path = os.path.join(FOLDER_DICT["gpx"], f"{activity_id}.gpx")
+            else:
+                continue
+            files.append((file_path, zip_file.read(file_info)))
+    return files
+
+
+async def download_garmin_data(client, activity_id, file_type="gpx", file_queue=None):
+    """
+    Download an activity and write its files, each with a single write.
+    With a `file_queue`, the path of every written file is put on it.
+    """
     folder = FOLDER_DICT.get(file_type, "gpx")
     try:
         file_data = await client.download_activity(activity_id, file_type=file_type)
-        file_path = os.path.join(folder, f"{activity_id}.{file_type}")
-        need_unzip = False
         if file_type == "fit":
-            file_path = os.path.join(folder, f"{activity_id}.zip")
-            need_unzip = True
-        async with aiofiles.open(file_path, "wb") as fb:
-            await fb.write(file_data)
-        if need_unzip:
-            zip_file = zipfile.ZipFile(file_path, "r")
-            for file_info in zip_file.infolist():
-                zip_file.extract(file_info, folder)
-                if file_info.filename.endswith(".fit"):
-                    os.rename(
-                        os.path.join(folder, f"{activity_id}_ACTIVITY.fit"),
-                        os.path.join(folder, f"{activity_id}.fit"),
-                    )
-                elif file_info.filename.endswith(".gpx"):
-                    os.rename(
-                        os.path.join(folder, f"{activity_id}_ACTIVITY.gpx"),
-                        os.path.join(FOLDER_DICT["gpx"], f"{activity_id}.gpx"),
-                    )
-                else:
-                    os.remove(os.path.join(folder, file_info.filename))
-            os.remove(file_path)
+            files = unzip_garmin_data(activity_id, file_data)
+        else:
+            files = [(os.path.join(folder, f"{activity_id}.{file_type}"), file_data)]
+        for file_path, data in files:
+            async with aiofiles.open(file_path, "wb") as fb:
+                await fb.write(data)
+            if file_queue is not None:
+                file_queue.put_nowait(file_path)
+        return True
     except Exception as e:
         print(f"Failed to download activity {activity_id}: {str(e)}")
         traceback.print_exc()
+        return False
+
+
+async def iter_activity_pages(client, start=0, page_size=100, prefetch=4):
+    """
+    Yield pages of activities, newest first.
+    Up to `prefetch` pages are requested concurrently, pages are still yielded
+    in order and listing stops after the first short page or at the first
+    empty one. Pages still prefetched then are cancelled.
+    """
+    pages = []
+    next_start = start
+    try:
+        while True:
+            while len(pages) < prefetch:
+                pages.append(
+                    asyncio.ensure_future(client.get_activities(next_start, page_size))
+                )
+                next_start += page_size
+            activities = await pages.pop(0)
+            if not activities:
+                return
+            print("Syncing Activity IDs")
+            yield activities
+            if len(activities) < page_size:
+                return
+    finally:
+        for page in pages:
+            page.cancel()
+        # collect the cancelled requests so their errors are not reported
+        await asyncio.gather(*pages, return_exceptions=True)
+
+
+async def iter_activity_ids(client, start=0, page_size=100, prefetch=4):
+    pages = iter_activity_pages(client, start, page_size, prefetch)
+    try:
+        async for activities in pages:
+            for a in activities:
+                yield str(a.get("activityId", ""))
+    finally:
+        # cancel the prefetched pages now, not when the pages are collected
+        await pages.aclose()
 
 
 async def get_activity_id_list(client, start=0):
-    activities = await client.get_activities(start, 100)
-    if len(activities) > 0:
-        ids = list(map(lambda a: str(a.get("activityId", "")), activities))
-        print("Syncing Activity IDs")
-        return ids + await get_activity_id_list(client, start + 100)
-    else:
-        return []
+    return [i async for i in iter_activity_ids(client, start)]
 
 
 async def gather_with_concurrency(n, tasks):
@@ -277,30 +343,181 @@ def get_downloaded_ids(folder):
     return [i.split(".")[0] for i in os.listdir(folder) if not i.startswith(".")]
 
 
+def get_sync_state_key(auth_domain, file_type, is_only_running=False):
+    domain = "cn" if auth_domain and str(auth_domain).upper() == "CN" else "com"
+    # an only-run sync skips other activities, it must not mark them synced
+    suffix = "_run" if is_only_running else ""
+    return f"garmin_{domain}_{file_type}{suffix}"
+
+
+def activity_id_number(activity_id):
+    return int(activity_id) if str(activity_id).isdigit() else None
+
+
 async def download_new_activities(
-    secret_string, auth_domain, downloaded_ids, is_only_running, folder, file_type
+    secret_string,
+    auth_domain,
+    downloaded_ids,
+    is_only_running,
+    folder,
+    file_type,
+    full=True,
+    file_queue=None,
 ):
+    """
+    Download the activities that are not in downloaded_ids.
+    With full=False listing stops at the first page without new activities,
+    where activity ids up to the largest one of the last sync count as known
+    too: Garmin ids grow in upload order, so activities uploaded late are
+    still new even if they started earlier. The largest id listed is saved
+    once all downloads succeeded.
+    With a `file_queue` the written files are put on it, see
+    download_garmin_data.
+    """
     client = Garmin(secret_string, auth_domain, is_only_running)
     # because I don't find a para for after time, so I use garmin-id as filename
     # to find new run to generage
-    activity_ids = await get_activity_id_list(client)
-    to_generate_garmin_ids = list(set(activity_ids) - set(downloaded_ids))
-    print(f"{len(to_generate_garmin_ids)} new activities to be downloaded")
+    known_ids = set(downloaded_ids)
+    state_key = get_sync_state_key(auth_domain, file_type, is_only_running)
+    last_synced = load_sync_state(state_key)
+    synced_up_to = None
+    if last_synced:
+        synced_up_to = activity_id_number(last_synced["activity_id"])
+        if not full:
+            print(f"Syncing activities uploaded after {last_synced['activity_id']}")
+
+    def is_known(activity):
+        activity_id = str(activity.get("activityId", ""))
+        if activity_id in known_ids:
+            return True
+        number = activity_id_number(activity_id)
+        return (
+            not full
+            and synced_up_to is not None
+            and number is not None
+            and number <= synced_up_to
+        )
+
+    to_generate_garmin_ids = []
+    semaphore = asyncio.Semaphore(10)
+
+    async def download(activity_id):
+        async with semaphore:
+            return await download_garmin_data(
+                client,
+                activity_id,
+                file_type=file_type,
+                file_queue=file_queue,
+            )
 
     start_time = time.time()
-    await gather_with_concurrency(
-        10,
-        [
-            download_garmin_data(client, id, file_type=file_type)
-            for id in to_generate_garmin_ids
-        ],
-    )
+    # downloads start while the following pages are still being listed
+    downloads = []
+    largest_id = synced_up_to
+    # an incremental sync usually needs a single page, so don't prefetch
+    pages = iter_activity_pages(client, prefetch=4 if full else 1)
+    try:
+        async for activities in pages:
+            for a in activities:
+                number = activity_id_number(a.get("activityId", ""))
+                if number is not None and (largest_id is None or number > largest_id):
+                    largest_id = number
+            new_activities = [a for a in activities if not is_known(a)]
+            if not full and not new_activities:
+                break
+            for a in new_activities:
+                activity_id = str(a.get("activityId", ""))
+                known_ids.add(activity_id)
+                to_generate_garmin_ids.append(activity_id)
+                downloads.append(asyncio.ensure_future(download(activity_id)))
+    finally:
+        # the prefetched page is cancelled before the client is closed
+        await pages.aclose()
+    print(f"{len(to_generate_garmin_ids)} new activities to be downloaded")
+    results = await asyncio.gather(*downloads)
     print(f"Download finished. Elapsed {time.time()-start_time} seconds")
+    client.scheduler.print_stats()
+    # keep the old state after failures, so the next sync retries them
+    if largest_id is not None and largest_id != synced_up_to and all(results):
+        save_sync_state(state_key, {"activity_id": str(largest_id)})
 
     await client.req.aclose()
     return to_generate_garmin_ids
 
 
+async def sync_new_activities(
+    secret_string,
+    auth_domain,
+    downloaded_ids,
+    is_only_running,
+    folder,
+    file_type,
+    full=True,
+    workers=None,
+):
+    """
+    Download new activities and save them to the database and activities.json.
+    Files left unsynced in the data folders (and the GPX folder for FIT, which
+    may hold files uploaded by the user) are queued first, downloaded files
+    are queued to parser processes right away, so parsing runs alongside the
+    downloads. A single writer then merges the tracks and upserts them in
+    batches, without listing the data folders again.
+    """
+    loop = asyncio.get_running_loop()
+    loader = TrackLoader()
+    workers = workers or os.cpu_count() or 1
+    file_queue = asyncio.Queue()
+    tracks = []
+
+    async def parse(executor):
+        while True:
+            file_path = await file_queue.get()
+            if file_path is None:
+                return
+            suffix = file_path.rsplit(".", 1)[-1]
+            load_func = loader.load_func_dict.get(suffix, load_gpx_file)
+            try:
+                tracks.append(
+                    await loop.run_in_executor(executor, load_func, file_path)
+                )
+            except TrackLoadError as e:
+                print(f"Error while loading {file_path}: {e}")
+
+    # listed before the downloads start, so downloaded files are queued once
+    data_folders = [(folder, file_type)]
+    if file_type == "fit" and os.path.isdir(FOLDER_DICT["gpx"]):
+        data_folders.append((FOLDER_DICT["gpx"], "gpx"))
+    for data_folder, file_suffix in data_folders:
+        for file_path in TrackLoader._list_data_files(data_folder, file_suffix):
+            file_queue.put_nowait(file_path)
+    print(f"Unsynced files: {file_queue.qsize()}")
+
+    start_time = time.time()
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        parsers = [asyncio.ensure_future(parse(executor)) for _ in range(workers)]
+        try:
+            new_ids = await download_new_activities(
+                secret_string,
+                auth_domain,
+                downloaded_ids,
+                is_only_running,
+                folder,
+                file_type,
+                full=full,
+                file_queue=file_queue,
+            )
+        finally:
+            for _ in parsers:
+                file_queue.put_nowait(None)
+            await asyncio.gather(*parsers)
+    print(f"Parsed {len(tracks)} files. Elapsed {time.time()-start_time} seconds")
+
+    generator = Generator(SQL_FILE)
+    generator.sync_from_tracks(loader.process_tracks(tracks))
+    export_activities_file(generator, JSON_FILE)
+    return new_ids
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -334,6 +551,18 @@ if __name__ == "__main__":
         default="gpx",
         help="to download personal documents or ebook",
     )
+    parser.add_argument(
+        "--full",
+        dest="full",
+        action="store_true",
+        help="list every activity instead of stopping at the last synced one",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        help="number of processes parsing the downloaded files, default one per CPU",
+    )
     options = parser.parse_args()
     secret_string = options.secret_string
     auth_domain = (
@@ -351,18 +580,17 @@ if __name__ == "__main__":
     downloaded_ids = get_downloaded_ids(folder)
 
     loop = asyncio.get_event_loop()
+    # fit may contain gpx(maybe upload by user), those are synced as well
     future = asyncio.ensure_future(
-        download_new_activities(
+        sync_new_activities(
             secret_string,
             auth_domain,
             downloaded_ids,
             is_only_running,
             folder,
             file_type,
+            full=options.full,
+            workers=options.workers,
         )
     )
     loop.run_until_complete(future)
-    # fit may contain gpx(maybe upload by user)
-    if file_type == "fit":
-        make_activities_file(SQL_FILE, FOLDER_DICT["gpx"], JSON_FILE, file_suffix="gpx")
-    make_activities_file(SQL_FILE, folder, JSON_FILE, file_suffix=file_type)
@@ -1,7 +1,10 @@
 import argparse
+import concurrent.futures
 import logging
 import os
 import sys
+import time
+from collections import defaultdict
 
 import appdirs
 from config import SQL_FILE
@@ -19,6 +22,19 @@ __app_name__ = "create_poster"
 __app_author__ = "flopp.net"
 
 
+def draw_year(drawer, year, tracks, output):
+    """Draw the circular poster of one year, return the time it took.
+
+    Runs in a worker process with its own copy of the drawer and its poster.
+    """
+    start = time.perf_counter()
+    p = drawer.poster
+    p.years.from_year, p.years.to_year = year, year
+    p.set_tracks(tracks)
+    p.draw(drawer, output)
+    return time.perf_counter() - start
+
+
 def main():
     """Handle command line arguments and call other modules as needed."""
 
@@ -179,6 +195,27 @@ def main():
         action="store_true",
         help="activities db file",
     )
+    args_parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Parse every track file again instead of using the parsed track cache.",
+    )
+    args_parser.add_argument(
+        "--svg-backend",
+        dest="svg_backend",
+        choices=["svgwrite", "stream"],
+        default="svgwrite",
+        help='How the SVG is written; "stream" writes elements to the file as they '
+        'are drawn instead of keeping the whole document in memory (default: "svgwrite").',
+    )
+    args_parser.add_argument(
+        "--svg-precision",
+        dest="svg_precision",
+        metavar="DIGITS",
+        type=int,
+        help="Decimals of numbers written by the stream backend (default: full precision).",
+    )
 
     for _, drawer in drawers.items():
         drawer.create_args(args_parser)
@@ -202,6 +239,8 @@ def main():
 
     loader.special_file_names = args.special
     loader.min_length = args.min_distance * 1000
+    if not args.no_cache:
+        loader.cache_dir = appdirs.user_cache_dir(__app_name__, __app_author__)
 
     if args.from_db:
         # for svg from db here if you want gpx please do not use --from-db
@@ -239,6 +278,8 @@ def main():
         "text": args.text_color,
     }
     p.units = args.units
+    p.svg_backend = args.svg_backend
+    p.svg_precision = args.svg_precision
     p.set_tracks(tracks)
     # circular not add footer and header
     p.drawer_type = "plain" if is_circular else "title"
@@ -247,11 +288,23 @@ def main():
     # for special circular
     if is_circular:
         years = p.years.all()[:]
-        for y in years:
-            p.years.from_year, p.years.to_year = y, y
-            # may be refactor
-            p.set_tracks(tracks)
-            p.draw(drawers[args.type], os.path.join("assets", f"year_{str(y)}.svg"))
+        tracks_by_year = defaultdict(list)
+        for t in tracks:
+            tracks_by_year[t.start_time_local.year].append(t)
+        drawer = drawers[args.type]
+        # the poster is copied to the workers with the drawer, without tracks
+        p.tracks, p.tracks_by_date = [], {}
+        outputs = [os.path.join("assets", f"year_{str(y)}.svg") for y in years]
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            timings = executor.map(
+                draw_year,
+                [drawer] * len(years),
+                years,
+                [tracks_by_year[y] for y in years],
+                outputs,
+            )
+            for output, seconds in zip(outputs, timings):
+                print(f"Created {output} in {seconds:.2f}s")
     else:
         p.draw(drawers[args.type], args.output)
 
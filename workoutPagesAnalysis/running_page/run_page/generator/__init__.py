@@ -5,11 +5,11 @@ import sys
 import arrow
 import stravalib
 from gpxtrackposter import track_loader
-from sqlalchemy import func
+from sqlalchemy import func, or_
 
-from polyline_processor import filter_out
+from polyline_processor import filter_out, filter_out_many
 
-from .db import Activity, init_db, update_or_create_activity
+from .db import Activity, init_db, update_or_create_activities
 
 from synced_data_file_logger import save_synced_data_file_list
 
@@ -26,6 +26,8 @@ class Generator:
         self.client_secret = ""
         self.refresh_token = ""
         self.only_run = False
+        # earliest date (YYYY-MM-DD) written by the syncs of this generator
+        self.changed_since = None
 
     def set_strava_config(self, client_id, client_secret, refresh_token):
         self.client_id = client_id
@@ -60,12 +62,9 @@ class Generator:
             else:
                 filters = {"before": datetime.datetime.utcnow()}
 
-        for activity in self.client.get_activities(**filters):
-            if self.only_run and activity.type != "Run":
-                continue
-            if IGNORE_BEFORE_SAVING:
-                activity.summary_polyline = filter_out(activity.summary_polyline)
-            created = update_or_create_activity(self.session, activity)
+        for created in update_or_create_activities(
+            self.session, self._strava_activities(filters)
+        ):
             if created:
                 sys.stdout.write("+")
             else:
@@ -73,9 +72,48 @@ class Generator:
             sys.stdout.flush()
         self.session.commit()
 
+    def _strava_activities(self, filters):
+        for activity in self.client.get_activities(**filters):
+            if self.only_run and activity.type != "Run":
+                continue
+            if IGNORE_BEFORE_SAVING:
+                activity.summary_polyline = filter_out(activity.summary_polyline)
+            self._mark_changed(activity.start_date_local)
+            yield activity
+
+    def _mark_changed(self, start_date_local):
+        date = str(start_date_local)[:10]
+        if self.changed_since is None or date < self.changed_since:
+            self.changed_since = date
+
+    def mark_changed_after(self, mark):
+        """Mark the activities stored after an export's high-water mark as changed.
+
+        mark holds the largest run_id and start_date_local of the export, so
+        activities written to the database but missing from the export, e.g.
+        because the export failed or they were added by another tool, are
+        exported again.
+        """
+        query = self.session.query(func.min(Activity.start_date_local)).filter(
+            Activity.distance > 0.1
+        )
+        if mark.get("run_id") is not None:
+            query = query.filter(
+                or_(
+                    Activity.run_id > mark["run_id"],
+                    Activity.start_date_local > mark["start_date_local"],
+                )
+            )
+        first_date = query.scalar()
+        if first_date is not None:
+            self._mark_changed(first_date)
+
     def sync_from_data_dir(self, data_dir, file_suffix="gpx"):
         loader = track_loader.TrackLoader()
         tracks = loader.load_tracks(data_dir, file_suffix=file_suffix)
+        self.sync_from_tracks(tracks)
+
+    def sync_from_tracks(self, tracks):
         print(f"load {len(tracks)} tracks")
         if not tracks:
             print("No tracks found.")
@@ -83,12 +121,15 @@ class Generator:
 
         synced_files = []
 
-        for t in tracks:
-            created = update_or_create_activity(self.session, t.to_namedtuple())
+        created_list = update_or_create_activities(
+            self.session, (t.to_namedtuple() for t in tracks)
+        )
+        for t, created in zip(tracks, created_list):
             if created:
                 sys.stdout.write("+")
             else:
                 sys.stdout.write(".")
+            self._mark_changed(t.start_time_local)
             synced_files.extend(t.file_names)
             sys.stdout.flush()
 
@@ -102,19 +143,26 @@ class Generator:
             return
         print("Syncing tracks '+' means new track '.' means update tracks")
         synced_files = []
-        for t in app_tracks:
-            created = update_or_create_activity(self.session, t)
+        created_list = update_or_create_activities(self.session, app_tracks)
+        for t, created in zip(app_tracks, created_list):
             if created:
                 sys.stdout.write("+")
             else:
                 sys.stdout.write(".")
+            self._mark_changed(t.start_date_local)
             if "file_names" in t:
                 synced_files.extend(t.file_names)
             sys.stdout.flush()
 
         self.session.commit()
 
-    def load(self):
+    def load(self, previous_activities=None):
+        """Return the activities to export, with their running streaks.
+
+        previous_activities is the list from the last export. When given, it is
+        kept up to the earliest date changed by this generator's syncs and only
+        the activities from that date on are read and processed again.
+        """
         activities = (
             self.session.query(Activity)
             .filter(Activity.distance > 0.1)
@@ -124,6 +172,23 @@ class Generator:
 
         streak = 0
         last_date = None
+        if previous_activities is not None:
+            if self.changed_since is None:
+                return previous_activities
+            activity_list = [
+                a
+                for a in previous_activities
+                if a["start_date_local"][:10] < self.changed_since
+            ]
+            if activity_list:
+                streak = activity_list[-1].get("streak", 0)
+                last_date = datetime.datetime.strptime(
+                    activity_list[-1]["start_date_local"], "%Y-%m-%d %H:%M:%S"
+                ).date()
+            activities = activities.filter(
+                Activity.start_date_local >= self.changed_since
+            )
+        loaded = []
         for activity in activities:
             if self.only_run and activity.type != "Run":
                 continue
@@ -142,9 +207,13 @@ class Generator:
                 streak = 1
             activity.streak = streak
             last_date = date
-            if not IGNORE_BEFORE_SAVING:
-                activity.summary_polyline = filter_out(activity.summary_polyline)
-            activity_list.append(activity.to_dict())
+            loaded.append(activity)
+
+        if not IGNORE_BEFORE_SAVING:
+            polylines = filter_out_many([a.summary_polyline for a in loaded])
+            for activity, summary_polyline in zip(loaded, polylines):
+                activity.summary_polyline = summary_polyline
+        activity_list.extend(activity.to_dict() for activity in loaded)
 
         return activity_list
 
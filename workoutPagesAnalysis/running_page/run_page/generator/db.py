@@ -1,14 +1,19 @@
 import datetime
+import os
 import random
 import string
 import time
 
 import geopy
+import s2sphere as s2
 from geopy.geocoders import Nominatim
 from sqlalchemy import Column, Float, Integer, Interval, String, create_engine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from .geocoder import NominatimGeocoder, OfflineGeocoder
+
 Base = declarative_base()
 
 
@@ -22,6 +27,17 @@ geopy.geocoders.options.default_user_agent = "my-application"
 # reverse the location (lan, lon) -> location detail
 g = Nominatim(user_agent=randomword())
 
+# point this at a GeoJSON file of named country/region polygons to geocode offline
+OFFLINE_GEOCODE_FILE = os.getenv("OFFLINE_GEOCODE_FILE")
+# anything with reverse(lat, lon) -> str or None can be plugged in here
+geocoder = (
+    OfflineGeocoder(OFFLINE_GEOCODE_FILE)
+    if OFFLINE_GEOCODE_FILE
+    else NominatimGeocoder(g)
+)
+# starts in the same s2 cell (level 14 is about 600m wide) share one lookup
+GEOCODE_CELL_LEVEL = 14
+
 
 ACTIVITY_KEYS = [
     "run_id",
@@ -37,6 +53,18 @@ ACTIVITY_KEYS = [
     "average_speed",
 ]
 
+# columns refreshed when an already stored activity is synced again
+ACTIVITY_UPDATE_KEYS = [
+    "name",
+    "distance",
+    "moving_time",
+    "elapsed_time",
+    "type",
+    "average_heartrate",
+    "average_speed",
+    "summary_polyline",
+]
+
 
 class Activity(Base):
     __tablename__ = "activities"
@@ -70,6 +98,38 @@ class Activity(Base):
         return out
 
 
+class GeocodeCache(Base):
+    __tablename__ = "geocode_cache"
+
+    cell = Column(String, primary_key=True)
+    location_country = Column(String)
+
+
+def reverse_geocode(session, lat, lon):
+    """Reverse geocode through the persistent geocode cache."""
+    cell = s2.CellId.from_lat_lng(s2.LatLng.from_degrees(lat, lon))
+    token = cell.parent(GEOCODE_CELL_LEVEL).to_token()
+    cached = session.query(GeocodeCache).filter_by(cell=token).first()
+    if cached:
+        return cached.location_country
+    location_country = geocoder.reverse(lat, lon)
+    if location_country:
+        session.add(GeocodeCache(cell=token, location_country=location_country))
+    return location_country
+
+
+def get_location_country(session, run_activity):
+    start_point = run_activity.start_latlng
+    location_country = getattr(run_activity, "location_country", "")
+    # or China for #176 to fix
+    if not location_country and start_point or location_country == "China":
+        location_country = (
+            reverse_geocode(session, start_point.lat, start_point.lon)
+            or location_country
+        )
+    return location_country
+
+
 def update_or_create_activity(session, run_activity):
     created = False
     try:
@@ -77,28 +137,6 @@ def update_or_create_activity(session, run_activity):
             session.query(Activity).filter_by(run_id=int(run_activity.id)).first()
         )
         if not activity:
-            start_point = run_activity.start_latlng
-            location_country = getattr(run_activity, "location_country", "")
-            # or China for #176 to fix
-            if not location_country and start_point or location_country == "China":
-                try:
-                    location_country = str(
-                        g.reverse(
-                            f"{start_point.lat}, {start_point.lon}", language="zh-CN"
-                        )
-                    )
-                # limit (only for the first time)
-                except Exception as e:
-                    try:
-                        location_country = str(
-                            g.reverse(
-                                f"{start_point.lat}, {start_point.lon}",
-                                language="zh-CN",
-                            )
-                        )
-                    except Exception as e:
-                        pass
-
             activity = Activity(
                 run_id=run_activity.id,
                 name=run_activity.name,
@@ -108,7 +146,7 @@ def update_or_create_activity(session, run_activity):
                 type=run_activity.type,
                 start_date=run_activity.start_date,
                 start_date_local=run_activity.start_date_local,
-                location_country=location_country,
+                location_country=get_location_country(session, run_activity),
                 average_heartrate=run_activity.average_heartrate,
                 average_speed=float(run_activity.average_speed),
                 summary_polyline=(
@@ -135,6 +173,71 @@ def update_or_create_activity(session, run_activity):
     return created
 
 
+def update_or_create_activities(session, run_activities, chunk_size=500):
+    """Batch version of update_or_create_activity.
+
+    The existing run_ids are fetched with one query and every chunk of activities
+    is written with one INSERT ... ON CONFLICT DO UPDATE, all inside the session
+    transaction. Yields created for every activity, in order, once its chunk is
+    written.
+    """
+    existing_ids = {run_id for (run_id,) in session.query(Activity.run_id)}
+    chunk = []
+    for run_activity in run_activities:
+        chunk.append(run_activity)
+        if len(chunk) >= chunk_size:
+            yield from _upsert_activities(session, chunk, existing_ids)
+            chunk = []
+    if chunk:
+        yield from _upsert_activities(session, chunk, existing_ids)
+
+
+def _upsert_activities(session, run_activities, existing_ids):
+    rows = []
+    created_list = []
+    for run_activity in run_activities:
+        created = False
+        try:
+            run_id = int(run_activity.id)
+            created = run_id not in existing_ids
+            rows.append(
+                {
+                    "run_id": run_id,
+                    "name": run_activity.name,
+                    "distance": float(run_activity.distance),
+                    "moving_time": run_activity.moving_time,
+                    "elapsed_time": run_activity.elapsed_time,
+                    "type": run_activity.type,
+                    "start_date": run_activity.start_date,
+                    "start_date_local": run_activity.start_date_local,
+                    # only used for new rows, updates keep the stored country
+                    "location_country": (
+                        get_location_country(session, run_activity) if created else ""
+                    ),
+                    "average_heartrate": run_activity.average_heartrate,
+                    "average_speed": float(run_activity.average_speed),
+                    "summary_polyline": (
+                        run_activity.map and run_activity.map.summary_polyline or ""
+                    ),
+                }
+            )
+            existing_ids.add(run_id)
+        except Exception as e:
+            created = False
+            print(f"something wrong with {run_activity.id}")
+            print(str(e))
+        created_list.append(created)
+
+    if rows:
+        stmt = sqlite_insert(Activity)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Activity.run_id],
+            set_={key: stmt.excluded[key] for key in ACTIVITY_UPDATE_KEYS},
+        )
+        session.execute(stmt, rows)
+    return created_list
+
+
 def init_db(db_path):
     engine = create_engine(
         f"sqlite:///{db_path}", connect_args={"check_same_thread": False}
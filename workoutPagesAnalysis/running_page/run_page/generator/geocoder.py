@@ -0,0 +1,80 @@
+import json
+import math
+from collections import defaultdict
+
+import numpy as np
+
+
+class NominatimGeocoder:
+    """Reverse geocode with the Nominatim web service, retrying once on failure."""
+
+    def __init__(self, client, language="zh-CN"):
+        self.client = client
+        self.language = language
+
+    def reverse(self, lat, lon):
+        try:
+            return str(self.client.reverse(f"{lat}, {lon}", language=self.language))
+        # limit (only for the first time)
+        except Exception:
+            try:
+                return str(self.client.reverse(f"{lat}, {lon}", language=self.language))
+            except Exception:
+                return None
+
+
+class OfflineGeocoder:
+    """Reverse geocode against a local GeoJSON file of country/region polygons.
+
+    Every feature needs a Polygon or MultiPolygon geometry and a "name" property,
+    which is what reverse() returns for points inside it. Polygon bounding boxes
+    are indexed on a one degree grid so a lookup only tests nearby polygons.
+    """
+
+    def __init__(self, geojson_file):
+        with open(geojson_file, "r", encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        # one entry per polygon: (name, [ring arrays of lng/lat])
+        self.polygons = []
+        self.grid = defaultdict(list)
+        for feature in features:
+            geometry = feature["geometry"]
+            if geometry["type"] == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry["type"] == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+            name = feature["properties"]["name"]
+            for polygon in polygons:
+                rings = [np.asarray(ring, dtype=np.float64) for ring in polygon]
+                self._add_polygon(name, rings)
+
+    def _add_polygon(self, name, rings):
+        index = len(self.polygons)
+        self.polygons.append((name, rings))
+        lng_lo, lat_lo = rings[0].min(axis=0)
+        lng_hi, lat_hi = rings[0].max(axis=0)
+        for i in range(math.floor(lat_lo), math.floor(lat_hi) + 1):
+            for j in range(math.floor(lng_lo), math.floor(lng_hi) + 1):
+                self.grid[(i, j)].append(index)
+
+    @staticmethod
+    def _contains(rings, lat, lon):
+        # even-odd ray casting over all rings, so holes are handled too
+        crossings = 0
+        for ring in rings:
+            x1, y1 = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+            spans = (y1 > lat) != (y2 > lat)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_cross = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+            crossings += np.count_nonzero(spans & (lon < x_cross))
+        return crossings % 2 == 1
+
+    def reverse(self, lat, lon):
+        for index in self.grid.get((math.floor(lat), math.floor(lon)), []):
+            name, rings = self.polygons[index]
+            if self._contains(rings, lat, lon):
+                return name
+        return None
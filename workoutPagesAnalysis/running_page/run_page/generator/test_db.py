@@ -0,0 +1,116 @@
+import datetime
+import random
+import time
+from collections import namedtuple
+
+import pytest
+
+import generator.db as db
+from generator.db import (
+    Activity,
+    init_db,
+    update_or_create_activities,
+    update_or_create_activity,
+)
+
+run_activity = namedtuple(
+    "run_activity",
+    "id name distance moving_time elapsed_time type start_date start_date_local "
+    "average_heartrate average_speed map start_latlng location_country",
+)
+run_map = namedtuple("polyline", "summary_polyline")
+start_point = namedtuple("start_point", "lat lon")
+
+
+class FakeGeocoder:
+    def reverse(self, lat, lon):
+        return f"{round(lat)}, {round(lon)}"
+
+
+@pytest.fixture(autouse=True)
+def fake_geocoder(monkeypatch):
+    monkeypatch.setattr(db, "geocoder", FakeGeocoder())
+
+
+def make_activities(count, seed=0, location_country=""):
+    rng = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1, 6, 0)
+    activities = []
+    for i in range(count):
+        start_date = start + datetime.timedelta(hours=13 * i)
+        moving_time = datetime.timedelta(seconds=rng.randint(600, 7200))
+        activities.append(
+            run_activity(
+                id=1_600_000_000_000 + i,
+                name=f"run {seed}",
+                distance=rng.uniform(1000, 30000),
+                moving_time=moving_time,
+                elapsed_time=moving_time + datetime.timedelta(seconds=60),
+                type="Run",
+                start_date=str(start_date),
+                start_date_local=str(start_date + datetime.timedelta(hours=8)),
+                average_heartrate=rng.choice([None, rng.uniform(120, 170)]),
+                average_speed=rng.uniform(2, 5),
+                map=run_map(rng.choice(["", f"poly{seed}_{i}"])),
+                start_latlng=rng.choice(
+                    [[], start_point(rng.uniform(-60, 60), rng.uniform(-170, 170))]
+                ),
+                location_country=location_country,
+            )
+        )
+    return activities
+
+
+def sync_per_row(session, activities):
+    created = [update_or_create_activity(session, a) for a in activities]
+    session.commit()
+    return created
+
+
+def sync_batch(session, activities, chunk_size=500):
+    created = list(update_or_create_activities(session, activities, chunk_size))
+    session.commit()
+    return created
+
+
+def rows(session):
+    columns = [c.name for c in Activity.__table__.columns]
+    return [
+        tuple(getattr(a, c) for c in columns)
+        for a in session.query(Activity).order_by(Activity.run_id)
+    ]
+
+
+def test_batch_upsert_matches_per_row_path():
+    per_row, batch = init_db(":memory:"), init_db(":memory:")
+    first = make_activities(300, seed=1)
+    # the stored countries and start dates are kept by both paths on update,
+    # the summary columns are replaced
+    stored = [a._replace(location_country="Somewhere") for a in first[:100]]
+    assert sync_per_row(per_row, stored) == sync_batch(batch, stored)
+    assert sync_per_row(per_row, first) == sync_batch(batch, first, chunk_size=64)
+    assert rows(per_row) == rows(batch)
+
+    again = make_activities(400, seed=2)
+    again = [a._replace(start_date_local="changed") for a in again]
+    assert sync_per_row(per_row, again) == sync_batch(batch, again, chunk_size=64)
+    assert rows(per_row) == rows(batch)
+    countries = {a.location_country for a in batch.query(Activity).limit(100)}
+    assert countries == {"Somewhere"}
+
+
+@pytest.mark.slow
+def test_benchmark_batch_upsert_against_per_row(tmp_path):
+    activities = make_activities(5000)
+    timings = {}
+    for name, sync in (("per row", sync_per_row), ("batch", sync_batch)):
+        session = init_db(str(tmp_path / f"{name}.db"))
+        start = time.perf_counter()
+        sync(session, activities)
+        initial = time.perf_counter() - start
+        start = time.perf_counter()
+        sync(session, activities)
+        timings[name] = (initial, time.perf_counter() - start)
+        print(f"\n{name}: import {initial:.2f}s, resync {timings[name][1]:.2f}s")
+    assert timings["batch"][0] < timings["per row"][0]
+    assert timings["batch"][1] < timings["per row"][1]
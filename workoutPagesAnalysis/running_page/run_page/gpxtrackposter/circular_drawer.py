@@ -138,18 +138,22 @@ class CircularDrawer(TracksDrawer):
                         stroke_width=0.3,
                     )
                 )
+                # explicit id, so the file does not depend on how many
+                # drawings were made before in this process
                 path = dr.path(
                     d=("M", center.x + r3 * sin_a1, center.y - r3 * cos_a1),
+                    id=f"month-{year}-{date.month}",
                     fill="none",
                     stroke="none",
                 )
                 path.push(
                     f"a{r3},{r3} 0 0,1 {r3 * (sin_a3 - sin_a1)},{r3 * (cos_a1 - cos_a3)}"
                 )
-                dr.add(path)
-                tpath = svgwrite.text.TextPath(
+                # the text path refers to the path by id
+                tpath = dr.textPath(
                     path, date.strftime("%B"), startOffset=(0.5 * r3 * (a3 - a1))
                 )
+                dr.add(path)
                 text = dr.text(
                     "",
                     fill=self.poster.colors["text"],
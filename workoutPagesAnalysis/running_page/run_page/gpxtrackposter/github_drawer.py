@@ -25,6 +25,25 @@ class GithubDrawer(TracksDrawer):
         year_length_style = f"font-size:{110 * 3.0 / 80.0}px; font-family:Arial;"
         month_names_style = f"font-size:2.5px; font-family:Arial"
         total_length_year_dict = self.poster.total_length_year_dict
+        distance1 = self.poster.special_distance["special_distance"]
+        distance2 = self.poster.special_distance["special_distance2"]
+        # color every day with tracks in one go, per palette
+        day_lengths = {
+            date: sum([t.length for t in tracks])
+            for date, tracks in self.poster.tracks_by_date.items()
+        }
+        day_colors = {}
+        if day_lengths:
+            lengths = list(day_lengths.values())
+            colors = self.colors(self.poster.length_range_by_date, lengths)
+            special_colors = self.colors(
+                self.poster.length_range_by_date, lengths, True
+            )
+            for date, length, color, special_color in zip(
+                day_lengths, lengths, colors, special_colors
+            ):
+                has_special = distance1 < length / 1000 < distance2
+                day_colors[date] = special_color if has_special else color
         for year in range(self.poster.years.from_year, self.poster.years.to_year + 1)[
             ::-1
         ]:
@@ -117,14 +136,8 @@ class GithubDrawer(TracksDrawer):
                     color = "#444444"
                     date_title = str(github_rect_day)
                     if date_title in self.poster.tracks_by_date:
-                        tracks = self.poster.tracks_by_date[date_title]
-                        length = sum([t.length for t in tracks])
-                        distance1 = self.poster.special_distance["special_distance"]
-                        distance2 = self.poster.special_distance["special_distance2"]
-                        has_special = distance1 < length / 1000 < distance2
-                        color = self.color(
-                            self.poster.length_range_by_date, length, has_special
-                        )
+                        length = day_lengths[date_title]
+                        color = day_colors[date_title]
                         if length / 1000 >= distance2:
                             color = self.poster.colors.get(
                                 "special2"
@@ -0,0 +1,46 @@
+"""Precomputed color gradients used to color tracks by length."""
+
+import functools
+from typing import List
+
+import numpy as np
+
+from .utils import interpolate_color
+
+
+class Palette:
+    """Gradient between two colors, precomputed as a lookup table.
+
+    interpolate_color goes through colour.Color and HSL for every call. A
+    palette does that once for each of its steps and quantizes the ratio to
+    the nearest step instead.
+
+    Attributes:
+        steps: Number of entries in the lookup table.
+        table: Hex colors for ratios 0, 1 / (steps - 1), ..., 1.
+
+    Methods:
+        color: Return the color for a ratio.
+        colors: Return the colors for an array of ratios.
+    """
+
+    def __init__(self, color1: str, color2: str, steps: int = 256):
+        self.steps = steps
+        self.table = [
+            interpolate_color(color1, color2, i / (steps - 1)) for i in range(steps)
+        ]
+
+    def color(self, ratio: float) -> str:
+        ratio = min(max(ratio, 0.0), 1.0)
+        return self.table[int(ratio * (self.steps - 1) + 0.5)]
+
+    def colors(self, ratios) -> List[str]:
+        ratios = np.clip(np.asarray(ratios, dtype=np.float64), 0.0, 1.0)
+        indices = (ratios * (self.steps - 1) + 0.5).astype(np.int64)
+        return [self.table[i] for i in indices.tolist()]
+
+
+@functools.lru_cache(maxsize=None)
+def get_palette(color1: str, color2: str) -> Palette:
+    """Return the shared palette for the gradient from color1 to color2."""
+    return Palette(color1, color2)
@@ -8,6 +8,7 @@ from datetime import datetime
 import pytz
 import svgwrite
 
+from .stream_drawing import StreamDrawing
 from .utils import format_float
 from .value_range import ValueRange
 from .xy import XY
@@ -30,6 +31,10 @@ class Poster:
         height: Poster height.
         years: Years included in the poster.
         tracks_drawer: drawer used to draw the poster.
+        svg_backend: "svgwrite" to build the whole document in memory before
+            saving it, "stream" to write elements out as they are drawn.
+        svg_precision: Decimals of numbers written by the "stream" backend,
+            None for full precision.
 
     Methods:
         set_tracks: Associate the Poster with a set of tracks
@@ -57,6 +62,8 @@ class Poster:
         self.height = 300
         self.years = None
         self.tracks_drawer = None
+        self.svg_backend = "svgwrite"
+        self.svg_precision = None
         self.trans = None
         self.set_language(None)
         self.tc_offset = datetime.now(pytz.timezone("Asia/Shanghai")).utcoffset()
@@ -114,7 +121,12 @@ class Poster:
             self.colors["track"] = "red"
             self.colors["special"] = "yellow"
             self.colors["text"] = "#e1ed5e"
-        d = svgwrite.Drawing(output, (f"{width}mm", f"{height}mm"))
+        if self.svg_backend == "stream":
+            d = StreamDrawing(
+                output, (f"{width}mm", f"{height}mm"), precision=self.svg_precision
+            )
+        else:
+            d = svgwrite.Drawing(output, (f"{width}mm", f"{height}mm"))
         d.viewbox(0, 0, self.width, height)
         d.add(d.rect((0, 0), (width, height), fill=self.colors["background"]))
         if not self.drawer_type == "plain":
@@ -0,0 +1,197 @@
+"""Write an SVG poster element by element instead of building an svgwrite DOM."""
+
+import os
+import xml.etree.ElementTree as etree
+from typing import Optional
+
+
+class StreamElement:
+    """A single SVG element, serialized as soon as it is added to the drawing.
+
+    Supports the parts of the svgwrite element API used by the drawers:
+    set_desc, add for child elements, push for path commands and get_iri.
+    """
+
+    def __init__(self, drawing, name: str, text: Optional[str] = None, **attribs):
+        self.drawing = drawing
+        self.name = name
+        self.text = text
+        self.attribs = {}
+        self.elements = []
+        self.commands = []
+        for key, value in attribs.items():
+            self[key.rstrip("_").replace("_", "-")] = value
+
+    def __setitem__(self, key, value):
+        self.attribs[key] = value
+
+    def set_desc(self, title=None, desc=None):
+        if desc is not None:
+            self.elements.insert(0, StreamElement(self.drawing, "desc", str(desc)))
+        if title is not None:
+            self.elements.insert(0, StreamElement(self.drawing, "title", str(title)))
+
+    def add(self, element):
+        self.elements.append(element)
+
+    def push(self, *elements):
+        self.commands.extend(elements)
+
+    def get_id(self) -> str:
+        if "id" not in self.attribs:
+            self.attribs["id"] = self.drawing.next_id()
+        return self.attribs["id"]
+
+    def get_iri(self) -> str:
+        return f"#{self.get_id()}"
+
+    def get_xml(self) -> etree.Element:
+        if self.commands:
+            self.attribs["d"] = self.drawing.format_list(self.commands, " ")
+        xml = etree.Element(self.name)
+        for key, value in sorted(self.attribs.items()):
+            if value is None:
+                continue
+            value = self.drawing.format_value(value)
+            if value:
+                xml.set(key, value)
+        if self.text is not None:
+            xml.text = self.text
+        for element in self.elements:
+            xml.append(element.get_xml())
+        return xml
+
+
+class StreamDrawing:
+    """Drop-in replacement for svgwrite.Drawing that streams to the output file.
+
+    Elements are written out as soon as they are added, so memory use does not
+    grow with the number of tracks. The markup matches svgwrite's. Numbers are
+    written like svgwrite does, or rounded to `precision` decimals if given.
+
+    Attributes:
+        filename: Output file name.
+        precision: Number of decimals for numbers, None keeps full precision.
+
+    Methods:
+        viewbox: Set the viewBox of the drawing, before adding elements.
+        add: Write an element to the output.
+        save: Finish the document and move it to filename.
+        rect, text, line, circle, path, polyline, textPath: Element factories
+            with the same arguments as svgwrite's.
+    """
+
+    def __init__(self, filename: str, size, precision: Optional[int] = None):
+        self.filename = filename
+        self.precision = precision
+        self.attribs = {
+            "baseProfile": "full",
+            "height": size[1],
+            "version": "1.1",
+            "width": size[0],
+            "xmlns": "http://www.w3.org/2000/svg",
+            "xmlns:ev": "http://www.w3.org/2001/xml-events",
+            "xmlns:xlink": "http://www.w3.org/1999/xlink",
+        }
+        self._next_id = 1
+        self._file = None
+
+    def next_id(self) -> str:
+        element_id = f"id{self._next_id}"
+        self._next_id += 1
+        return element_id
+
+    def format_number(self, value) -> str:
+        if self.precision is None or not isinstance(value, float):
+            return str(value)
+        text = f"{value:.{self.precision}f}"
+        if "." in text:
+            text = text.rstrip("0").rstrip(".")
+        return "0" if text == "-0" else text
+
+    def format_value(self, value) -> str:
+        if isinstance(value, (int, float)):
+            return self.format_number(value)
+        return str(value)
+
+    def format_list(self, values, separator: str = ",") -> str:
+        if isinstance(values, str):
+            return values
+        strings = []
+        for value in values:
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple)):
+                strings.append(self.format_list(value, separator))
+            else:
+                strings.append(self.format_value(value))
+        return separator.join(strings)
+
+    def viewbox(self, minx=0, miny=0, width=0, height=0):
+        self.attribs["viewBox"] = self.format_list([minx, miny, width, height])
+
+    def _open(self):
+        self._file = open(f"{self.filename}.tmp", "w", encoding="utf-8")
+        self._file.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        svg = etree.Element("svg")
+        for key, value in sorted(self.attribs.items()):
+            svg.set(key, self.format_value(value))
+        # an empty element serializes as '<svg ... />', keep it open instead
+        self._file.write(etree.tostring(svg, encoding="unicode")[:-3] + ">")
+        self._file.write("<defs />")
+
+    def add(self, element: StreamElement):
+        if self._file is None:
+            self._open()
+        self._file.write(etree.tostring(element.get_xml(), encoding="unicode"))
+
+    def save(self):
+        if self._file is None:
+            self._open()
+        self._file.write("</svg>")
+        self._file.close()
+        self._file = None
+        os.replace(f"{self.filename}.tmp", self.filename)
+
+    def rect(self, insert=(0, 0), size=(1, 1), **extra) -> StreamElement:
+        element = StreamElement(self, "rect", **extra)
+        element["x"], element["y"] = insert
+        element["width"], element["height"] = size
+        return element
+
+    def text(self, text, insert=None, **extra) -> StreamElement:
+        element = StreamElement(self, "text", text, **extra)
+        if insert is not None:
+            element["x"] = self.format_list([insert[0]])
+            element["y"] = self.format_list([insert[1]])
+        return element
+
+    def line(self, start=(0, 0), end=(0, 0), **extra) -> StreamElement:
+        element = StreamElement(self, "line", **extra)
+        element["x1"], element["y1"] = start
+        element["x2"], element["y2"] = end
+        return element
+
+    def circle(self, center=(0, 0), r=1, **extra) -> StreamElement:
+        element = StreamElement(self, "circle", **extra)
+        element["cx"], element["cy"] = center
+        element["r"] = r
+        return element
+
+    def path(self, d=None, **extra) -> StreamElement:
+        element = StreamElement(self, "path", **extra)
+        element.push(d)
+        return element
+
+    def polyline(self, points=(), **extra) -> StreamElement:
+        element = StreamElement(self, "polyline", **extra)
+        element["points"] = " ".join(
+            f"{self.format_number(x)},{self.format_number(y)}" for x, y in points
+        )
+        return element
+
+    def textPath(self, path, text, startOffset=None, **extra) -> StreamElement:
+        element = StreamElement(self, "textPath", text, **extra)
+        element["startOffset"] = startOffset
+        element["xlink:href"] = path.get_iri()
+        return element
@@ -0,0 +1,66 @@
+import random
+
+import numpy as np
+import pytest
+
+from gpxtrackposter.palette import Palette
+from gpxtrackposter.poster import Poster
+from gpxtrackposter.tracks_drawer import TracksDrawer
+from gpxtrackposter.utils import interpolate_color
+from gpxtrackposter.value_range import ValueRange
+
+# per channel, out of 255
+TOLERANCE = 2
+
+rng = random.Random(0)
+COLOR_PAIRS = [
+    ("#4DD2FF", "#FF00FF"),
+    ("#FFFF00", "#00FF00"),
+    ("#E1ED5E", "#E1ED5E"),
+    ("#000000", "#FFFFFF"),
+    ("red", "yellow"),
+] + [tuple(f"#{rng.randrange(2**24):06X}" for _ in range(2)) for _ in range(20)]
+
+
+def channels(color):
+    return np.array([int(color[i : i + 2], 16) for i in (1, 3, 5)])
+
+
+@pytest.mark.parametrize("color1, color2", COLOR_PAIRS)
+def test_palette_stays_close_to_interpolate_color(color1, color2):
+    palette = Palette(color1, color2)
+    ratios = np.concatenate(
+        (
+            [-1.0, 0.0, 1.0, 2.0],
+            np.linspace(0, 1, 1001),
+            np.random.default_rng(0).random(500),
+        )
+    )
+    for ratio in ratios.tolist():
+        expected = interpolate_color(color1, color2, ratio)
+        difference = np.abs(channels(palette.color(ratio)) - channels(expected))
+        assert difference.max() <= TOLERANCE, (ratio, palette.color(ratio), expected)
+    # the endpoints are exact
+    assert palette.color(0) == interpolate_color(color1, color2, 0)
+    assert palette.color(1) == interpolate_color(color1, color2, 1)
+
+
+@pytest.mark.parametrize("is_special", [False, True])
+def test_colors_matches_color(is_special):
+    poster = Poster()
+    poster.colors.update({"track2": "#FF00FF", "special2": "#00FF00"})
+    drawer = TracksDrawer(poster)
+    lengths = np.random.default_rng(1).uniform(0, 42000, 1000).tolist()
+    length_range = ValueRange()
+    for length in lengths[100:]:
+        length_range.extend(length)
+    # lengths outside the range are clamped by both
+    expected = [drawer.color(length_range, x, is_special) for x in lengths]
+    assert drawer.colors(length_range, lengths, is_special) == expected
+
+    single = ValueRange()
+    single.extend(5000)
+    assert (
+        drawer.colors(single, [5000, 6000], is_special)
+        == [drawer.color(single, 5000, is_special)] * 2
+    )
@@ -0,0 +1,78 @@
+import datetime
+import re
+import xml.etree.ElementTree as etree
+
+import gpxpy as mod_gpxpy
+import pytest
+
+from gpxtrackposter.circular_drawer import CircularDrawer
+from gpxtrackposter.github_drawer import GithubDrawer
+from gpxtrackposter.grid_drawer import GridDrawer
+from gpxtrackposter.poster import Poster
+from gpxtrackposter.test_track import make_gpx
+from gpxtrackposter.track import Track
+
+DRAWERS = {"grid": GridDrawer, "github": GithubDrawer, "circular": CircularDrawer}
+
+
+@pytest.fixture(scope="module")
+def tracks():
+    tracks = []
+    start = datetime.datetime(2022, 11, 1, 6, 0)
+    for i in range(40):
+        track = Track()
+        start_time = start + datetime.timedelta(days=3 * i, hours=i % 5)
+        gpx = make_gpx([60 + i, 20], seed=i, start=start_time)
+        track._load_gpx_data(mod_gpxpy.parse(gpx))
+        track.special = i % 7 == 0
+        tracks.append(track)
+    return tracks
+
+
+def render(tracks, kind, output, backend, precision=None):
+    p = Poster()
+    p.athlete = "athlete"
+    p.title = "title"
+    p.svg_backend = backend
+    p.svg_precision = precision
+    p.special_distance = {"special_distance": 10.0, "special_distance2": 20.0}
+    p.colors = {
+        "background": "#222222",
+        "track": "#4DD2FF",
+        "track2": "#FF00FF",
+        "special": "#FFFF00",
+        "special2": "#00FF00",
+        "text": "#FFFFFF",
+    }
+    p.set_tracks(tracks)
+    p.drawer_type = "plain" if kind == "circular" else "title"
+    if kind == "github":
+        p.height = 55 + p.years.count() * 43
+    if kind == "circular":
+        p.years.from_year = p.years.to_year = 2023
+        p.set_tracks(tracks)
+    p.draw(DRAWERS[kind](p), str(output))
+    return output.read_text()
+
+
+def numbers(svg):
+    return [float(n) for n in re.findall(r"-?\d+\.?\d*(?:e-?\d+)?", svg)]
+
+
+@pytest.mark.parametrize("kind", DRAWERS)
+def test_stream_backend_writes_the_svgwrite_markup(tracks, kind, tmp_path):
+    svgwrite_svg = render(tracks, kind, tmp_path / "svgwrite.svg", "svgwrite")
+    stream_svg = render(tracks, kind, tmp_path / "stream.svg", "stream")
+    assert stream_svg == svgwrite_svg
+    assert not (tmp_path / "stream.svg.tmp").exists()
+
+
+@pytest.mark.parametrize("kind", DRAWERS)
+def test_stream_backend_rounds_numbers(tracks, kind, tmp_path):
+    svgwrite_svg = render(tracks, kind, tmp_path / "svgwrite.svg", "svgwrite")
+    stream_svg = render(tracks, kind, tmp_path / "stream.svg", "stream", 2)
+    etree.fromstring(stream_svg.encode("utf-8"))
+    assert len(stream_svg) < len(svgwrite_svg)
+    rounded, full = numbers(stream_svg), numbers(svgwrite_svg)
+    assert len(rounded) == len(full)
+    assert all(abs(a - b) <= 0.005 + 1e-9 for a, b in zip(rounded, full))
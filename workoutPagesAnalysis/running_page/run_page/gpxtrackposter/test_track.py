@@ -0,0 +1,127 @@
+import datetime
+import random
+import tracemalloc
+
+import gpxpy as mod_gpxpy
+import numpy as np
+import polyline
+import pytest
+import s2sphere as s2
+
+from gpxtrackposter.track import SEMICIRCLE, Track
+
+
+def make_gpx(segments, seed=0, start=datetime.datetime(2024, 5, 1, 6, 0)):
+    rng = random.Random(seed)
+    gpx = mod_gpxpy.gpx.GPX()
+    track = mod_gpxpy.gpx.GPXTrack()
+    gpx.tracks.append(track)
+    time = start.replace(tzinfo=datetime.timezone.utc)
+    lat, lng = 31.2, 121.4
+    for points in segments:
+        segment = mod_gpxpy.gpx.GPXTrackSegment()
+        track.segments.append(segment)
+        for _ in range(points):
+            lat += rng.uniform(-1e-4, 3e-4)
+            lng += rng.uniform(-1e-4, 3e-4)
+            time += datetime.timedelta(seconds=1)
+            segment.points.append(
+                mod_gpxpy.gpx.GPXTrackPoint(lat, lng, elevation=10, time=time)
+            )
+    return gpx.to_xml()
+
+
+def old_lines(xml):
+    # the list of s2.LatLng lines and the flat [lat, lng] container the Track
+    # kept before the columnar storage, built the same way _load_gpx_data did
+    gpx = mod_gpxpy.parse(xml)
+    gpx.simplify()
+    polylines, polyline_container = [], []
+    for t in gpx.tracks:
+        for s in t.segments:
+            polylines.append(
+                [s2.LatLng.from_degrees(p.latitude, p.longitude) for p in s.points]
+            )
+            polyline_container.extend([[p.latitude, p.longitude] for p in s.points])
+    return polylines, polyline_container
+
+
+@pytest.mark.parametrize("segments", [[50], [40, 1, 60], [30, 30, 30, 30]])
+def test_polylines_match_list_of_lists(segments):
+    xml = make_gpx(segments)
+    track = Track()
+    track._load_gpx_data(mod_gpxpy.parse(xml))
+    polylines, polyline_container = old_lines(xml)
+
+    assert len(track.polylines) == len(polylines)
+    for line, old_line in zip(track.polylines, polylines):
+        assert [s2.LatLng.from_degrees(lat, lng) for lat, lng in line] == old_line
+    assert track.polyline_str == polyline.encode(polyline_container)
+    assert track.to_namedtuple().map.summary_polyline == track.polyline_str
+    assert list(track.start_latlng) == polyline_container[0]
+
+
+def test_append_keeps_lines_apart():
+    first, second = Track(), Track()
+    first._load_gpx_data(mod_gpxpy.parse(make_gpx([20, 25], seed=1)))
+    second._load_gpx_data(mod_gpxpy.parse(make_gpx([30], seed=2)))
+    lines = [line.tolist() for line in first.polylines + second.polylines]
+    container = first.latlngs.tolist() + second.latlngs.tolist()
+
+    first.append(second)
+    assert [line.tolist() for line in first.polylines] == lines
+    assert first.polyline_str == polyline.encode(container)
+
+
+def fit_messages(points, rng):
+    lat = rng.integers(-SEMICIRCLE * 60, SEMICIRCLE * 60)
+    lng = rng.integers(-SEMICIRCLE * 170, SEMICIRCLE * 170)
+    steps = rng.integers(-200, 600, size=(points, 2)).cumsum(axis=0)
+    return {
+        "session_mesgs": [
+            {
+                "start_time": 1_000_000_000,
+                "total_elapsed_time": points,
+                "total_timer_time": points,
+                "total_distance": points * 3.0,
+                "sport": "running",
+                "enhanced_avg_speed": 3.0,
+                "avg_speed": 3.0,
+            }
+        ],
+        "record_mesgs": [
+            {"position_lat": int(lat + a), "position_long": int(lng + b)}
+            for a, b in steps
+        ],
+    }
+
+
+@pytest.mark.slow
+def test_peak_memory_of_large_corpus(monkeypatch):
+    # the timezone lookup is not what is measured here
+    monkeypatch.setattr(
+        "gpxtrackposter.track.parse_datetime_to_local",
+        lambda start, end, point: (start, end),
+    )
+    rng = np.random.default_rng(0)
+    tracks_count, points = 500, 3600
+
+    tracemalloc.start()
+    tracks = []
+    for _ in range(tracks_count):
+        track = Track()
+        # the decoded messages of one file are dropped once it is loaded
+        track._load_fit_data(fit_messages(points, rng))
+        tracks.append(track)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    coordinates = tracks_count * points * 2 * 8
+    print(
+        f"\n{tracks_count * points} points: {current / 2**20:.1f} MiB held, "
+        f"{peak / 2**20:.1f} MiB peak, {coordinates / 2**20:.1f} MiB of float64"
+    )
+    # the points are held as float64 pairs and little else, s2.LatLng objects
+    # and [lat, lng] lists took about 350 bytes per point
+    assert current < coordinates * 1.1
+    assert peak < coordinates * 1.1 + 16 * 2**20
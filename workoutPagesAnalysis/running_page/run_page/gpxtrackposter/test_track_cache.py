@@ -0,0 +1,96 @@
+import datetime
+import os
+import time
+
+import gpxpy as mod_gpxpy
+import pytest
+
+from gpxtrackposter.test_track import make_gpx
+from gpxtrackposter.track import PARSER_VERSION, Track
+from gpxtrackposter.track_cache import TrackCache
+from gpxtrackposter.track_loader import TrackLoader
+
+
+def write_gpx_files(data_dir, count, points):
+    data_dir.mkdir(exist_ok=True)
+    for i in range(count):
+        # one activity per day, so the loader does not merge them
+        start = datetime.datetime(2010, 1, 1, 6, 0) + datetime.timedelta(days=i)
+        (data_dir / f"{i}.gpx").write_text(make_gpx([points], seed=i, start=start))
+
+
+def test_opening_removes_only_old_track_versions(tmp_path):
+    (tmp_path / "tracks" / "v0").mkdir(parents=True)
+    # directories of other users of the shared cache dir are left alone
+    (tmp_path / "v0").mkdir()
+    (tmp_path / "vendor").mkdir()
+
+    cache = TrackCache(str(tmp_path))
+    assert cache.cache_dir == str(tmp_path / "tracks" / f"v{PARSER_VERSION}")
+    assert sorted(os.listdir(tmp_path / "tracks")) == [f"v{PARSER_VERSION}"]
+    assert sorted(os.listdir(tmp_path)) == ["tracks", "v0", "vendor"]
+
+
+def test_get_put_and_invalidation(tmp_path):
+    file_name = tmp_path / "1.gpx"
+    file_name.write_text(make_gpx([40]))
+    track = Track()
+    track._load_gpx_data(mod_gpxpy.parse(file_name.read_text()))
+
+    cache = TrackCache(str(tmp_path / "cache"))
+    assert cache.get(str(file_name)) is None
+    cache.put(str(file_name), track)
+    cached = cache.get(str(file_name))
+    assert cached.polyline_str == track.polyline_str
+    assert cached.line_offsets.tolist() == track.line_offsets.tolist()
+
+    # a changed file is a cache miss
+    file_name.write_text(make_gpx([41]))
+    assert cache.get(str(file_name)) is None
+
+
+def test_evict_drops_least_recently_used(tmp_path):
+    cache = TrackCache(str(tmp_path / "cache"), max_size=0)
+    track = Track()
+    track._load_gpx_data(mod_gpxpy.parse(make_gpx([40])))
+    file_names = []
+    for i in range(3):
+        file_name = tmp_path / f"{i}.gpx"
+        file_name.write_text(str(i))
+        cache.put(str(file_name), track)
+        file_names.append(str(file_name))
+    entry_size = os.path.getsize(cache._entry_path(file_names[0]))
+    for i, file_name in enumerate(file_names):
+        os.utime(cache._entry_path(file_name), ns=(i, i))
+    cache.get(file_names[0])
+
+    cache.max_size = 2 * entry_size
+    cache.evict()
+    assert cache.get(file_names[1]) is None
+    assert cache.get(file_names[0]) is not None
+    assert cache.get(file_names[2]) is not None
+
+
+@pytest.mark.slow
+def test_benchmark_cold_and_warm_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "gpxtrackposter.track_loader.load_synced_file_list", lambda: set()
+    )
+    data_dir = tmp_path / "GPX_OUT"
+    write_gpx_files(data_dir, 5000, 60)
+    loader = TrackLoader()
+    loader.cache_dir = str(tmp_path / "cache")
+
+    start = time.perf_counter()
+    cold = loader.load_tracks(str(data_dir))
+    cold_time = time.perf_counter() - start
+    start = time.perf_counter()
+    warm = loader.load_tracks(str(data_dir))
+    warm_time = time.perf_counter() - start
+    print(f"\n5000 files: cold {cold_time:.2f}s, warm {warm_time:.2f}s")
+
+    def key(t):
+        return t.run_id, t.polyline_str
+
+    assert sorted(map(key, warm)) == sorted(map(key, cold))
+    assert warm_time < cold_time / 2
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from gpxtrackposter.utils import compute_grid
+from gpxtrackposter.xy import XY
+
+
+def compute_grid_quadratic(count, dimensions):
+    # the O(count^2) search compute_grid replaced, kept as the reference
+    min_waste = -1.0
+    best_size = None
+    best_counts = None
+    for count_x in range(1, count + 1):
+        size_x = dimensions.x / count_x
+        for count_y in range(1, count + 1):
+            if count_x * count_y >= count:
+                size_y = dimensions.y / count_y
+                size = min(size_x, size_y)
+                waste = dimensions.x * dimensions.y - count * size * size
+                if waste < 0:
+                    continue
+                elif best_size is None or waste < min_waste:
+                    best_size = size
+                    best_counts = count_x, count_y
+                    min_waste = waste
+    return best_size, best_counts
+
+
+DIMENSIONS = [
+    XY(200, 190),
+    XY(200, 200),
+    XY(180, 250),
+    XY(1, 1),
+    XY(100, 10),
+    XY(0.3, 7.1),
+]
+
+
+@pytest.mark.parametrize("dimensions", DIMENSIONS)
+def test_compute_grid_matches_quadratic_search(dimensions):
+    for count in range(0, 61):
+        assert compute_grid(count, dimensions) == compute_grid_quadratic(
+            count, dimensions
+        ), count
+
+
+def test_compute_grid_matches_quadratic_search_sampled():
+    rng = random.Random(0)
+    for _ in range(25):
+        count = rng.randint(61, 600)
+        dimensions = XY(rng.uniform(1, 500), rng.uniform(1, 500))
+        assert compute_grid(count, dimensions) == compute_grid_quadratic(
+            count, dimensions
+        ), (count, dimensions)
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("dimensions", DIMENSIONS)
+def test_compute_grid_matches_quadratic_search_exhaustive(dimensions):
+    for count in range(61, 301):
+        assert compute_grid(count, dimensions) == compute_grid_quadratic(
+            count, dimensions
+        ), count
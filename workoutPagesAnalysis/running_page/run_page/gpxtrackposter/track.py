@@ -6,11 +6,13 @@
 # license that can be found in the LICENSE file.
 
 import datetime
+import math
 import os
 from collections import namedtuple
 
 import gpxpy as mod_gpxpy
 import lxml
+import numpy as np
 import polyline
 import s2sphere as s2
 from garmin_fit_sdk import Decoder, Stream
@@ -34,12 +36,18 @@ IGNORE_BEFORE_SAVING = os.getenv("IGNORE_BEFORE_SAVING", False)
 # So dividing latitude and longitude (int32) value by 11930465 will give the decimal value.
 SEMICIRCLE = 11930465
 
+# Bump whenever the loaders change what a parsed Track holds, this invalidates
+# the tracks cached on disk by TrackCache.
+PARSER_VERSION = 1
+
 
 class Track:
     def __init__(self):
         self.file_names = []
-        self.polylines = []
-        self.polyline_str = ""
+        # all points of the track as one contiguous (n, 2) array of lat/lng degrees,
+        # line i is latlngs[line_offsets[i]:line_offsets[i + 1]]
+        self.latlngs = np.empty((0, 2), dtype=np.float64)
+        self.line_offsets = np.zeros(1, dtype=np.int64)
         self.start_time = None
         self.end_time = None
         self.start_time_local = None
@@ -119,15 +127,47 @@ class Track:
         else:
             summary_polyline = activity.summary_polyline
         polyline_data = polyline.decode(summary_polyline) if summary_polyline else []
-        self.polylines = [[s2.LatLng.from_degrees(p[0], p[1]) for p in polyline_data]]
+        self._set_lines([polyline_data])
         self.run_id = activity.run_id
 
+    @property
+    def polylines(self):
+        """The lines of the track as (n, 2) lat/lng views into self.latlngs."""
+        offsets = self.line_offsets.tolist()
+        return [self.latlngs[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+
+    @property
+    def polyline_str(self):
+        return polyline.encode(self.latlngs.tolist()) if len(self.latlngs) else ""
+
+    def _set_lines(self, lines):
+        """Store lines of (lat, lng) pairs as one contiguous array plus line offsets."""
+        arrays = [np.asarray(line, dtype=np.float64).reshape(-1, 2) for line in lines]
+        lengths = [len(a) for a in arrays]
+        latlngs = np.concatenate(arrays) if arrays else np.empty((0, 2))
+        if np.isnan(latlngs).any():
+            raise TrackLoadError("Track has invalid position values.")
+        self.latlngs = latlngs
+        self.line_offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+
+    def _first_latlng(self):
+        return self.latlngs[0].tolist()
+
     def bbox(self):
         """Compute the smallest rectangle that contains the entire track (border box)."""
+        if not len(self.latlngs):
+            return s2.LatLngRect()
+        lat_lo, lng_lo = np.radians(self.latlngs.min(axis=0)).tolist()
+        lat_hi, lng_hi = np.radians(self.latlngs.max(axis=0)).tolist()
+        if lng_lo > -math.pi and lng_hi - lng_lo < math.pi:
+            return s2.LatLngRect(
+                s2.LineInterval(lat_lo, lat_hi), s2.SphereInterval(lng_lo, lng_hi)
+            )
+        # the track crosses the antimeridian, let s2 pick the shorter way around
         bbox = s2.LatLngRect()
-        for line in self.polylines:
-            for latlng in line:
-                bbox = bbox.union(s2.LatLngRect.from_point(latlng.normalized()))
+        for lat, lng in self.latlngs.tolist():
+            latlng = s2.LatLng.from_degrees(lat, lng)
+            bbox = bbox.union(s2.LatLngRect.from_point(latlng.normalized()))
         return bbox
 
     @staticmethod
@@ -144,26 +184,21 @@ class Track:
         moving_time = int(self.end_time.timestamp() - self.start_time.timestamp())
         self.run_id = self.__make_run_id(self.start_time)
         self.average_heartrate = tcx.hr_avg
-        polyline_container = []
         position_values = [(i.latitude, i.longitude) for i in tcx.trackpoints]
         if not position_values and int(self.length) == 0:
             raise Exception(
                 f"This {file_name} TCX file do not contain distance and position values we ignore it"
             )
         if position_values:
-            line = [s2.LatLng.from_degrees(p[0], p[1]) for p in position_values]
-            self.polylines.append(line)
-            polyline_container.extend([[p[0], p[1]] for p in position_values])
-            self.polyline_container = polyline_container
+            self._set_lines([position_values])
             self.start_time_local, self.end_time_local = parse_datetime_to_local(
-                self.start_time, self.end_time, polyline_container[0]
+                self.start_time, self.end_time, self._first_latlng()
             )
             # get start point
             try:
-                self.start_latlng = start_point(*polyline_container[0])
+                self.start_latlng = start_point(*self._first_latlng())
             except:
                 pass
-            self.polyline_str = polyline.encode(polyline_container)
         self.moving_dict = {
             "distance": self.length,
             "moving_time": datetime.timedelta(seconds=moving_time),
@@ -185,7 +220,7 @@ class Track:
         if self.length == 0:
             raise TrackLoadError("Track is empty.")
         gpx.simplify()
-        polyline_container = []
+        lines = []
         heart_rate_list = []
         for t in gpx.tracks:
             for s in t.segments:
@@ -208,29 +243,23 @@ class Track:
                     heart_rate_list = list(filter(None, heart_rate_list))
                 except:
                     pass
-                line = [
-                    s2.LatLng.from_degrees(p.latitude, p.longitude) for p in s.points
-                ]
-                self.polylines.append(line)
-                polyline_container.extend([[p.latitude, p.longitude] for p in s.points])
-                self.polyline_container = polyline_container
+                lines.append([(p.latitude, p.longitude) for p in s.points])
+        self._set_lines(lines)
         # get start point
         try:
-            self.start_latlng = start_point(*polyline_container[0])
+            self.start_latlng = start_point(*self._first_latlng())
         except:
             pass
         self.start_time_local, self.end_time_local = parse_datetime_to_local(
-            self.start_time, self.end_time, polyline_container[0]
+            self.start_time, self.end_time, self._first_latlng()
         )
-        self.polyline_str = polyline.encode(polyline_container)
         self.average_heartrate = (
             sum(heart_rate_list) / len(heart_rate_list) if heart_rate_list else None
         )
         self.moving_dict = self._get_moving_data(gpx)
 
     def _load_fit_data(self, fit: dict):
-        _polylines = []
-        self.polyline_container = []
+        positions = []
         message = fit["session_mesgs"][0]
         self.start_time = datetime.datetime.utcfromtimestamp(
             (message["start_time"] + FIT_EPOCH_S)
@@ -264,17 +293,14 @@ class Track:
         )
         for record in fit["record_mesgs"]:
             if "position_lat" in record and "position_long" in record:
-                lat = record["position_lat"] / SEMICIRCLE
-                lng = record["position_long"] / SEMICIRCLE
-                _polylines.append(s2.LatLng.from_degrees(lat, lng))
-                self.polyline_container.append([lat, lng])
-        if self.polyline_container:
+                positions.append((record["position_lat"], record["position_long"]))
+        if positions:
+            # semicircles are exact in float64, so this matches dividing one by one
+            self._set_lines([np.array(positions, dtype=np.float64) / SEMICIRCLE])
             self.start_time_local, self.end_time_local = parse_datetime_to_local(
-                self.start_time, self.end_time, self.polyline_container[0]
+                self.start_time, self.end_time, self._first_latlng()
             )
-            self.start_latlng = start_point(*self.polyline_container[0])
-            self.polylines.append(_polylines)
-            self.polyline_str = polyline.encode(self.polyline_container)
+            self.start_latlng = start_point(*self._first_latlng())
         else:
             self.start_time_local, self.end_time_local = parse_datetime_to_local(
                 self.start_time, self.end_time, None
@@ -284,13 +310,15 @@ class Track:
         """Append other track to self."""
         self.end_time = other.end_time
         self.length += other.length
+        self.latlngs = np.concatenate((self.latlngs, other.latlngs))
+        self.line_offsets = np.concatenate(
+            (self.line_offsets, other.line_offsets[1:] + self.line_offsets[-1])
+        )
         # TODO maybe a better way
         try:
             self.moving_dict["distance"] += other.moving_dict["distance"]
             self.moving_dict["moving_time"] += other.moving_dict["moving_time"]
             self.moving_dict["elapsed_time"] += other.moving_dict["elapsed_time"]
-            self.polyline_container.extend(other.polyline_container)
-            self.polyline_str = polyline.encode(self.polyline_container)
             self.moving_dict["average_speed"] = (
                 self.moving_dict["distance"]
                 / self.moving_dict["moving_time"].total_seconds()
@@ -0,0 +1,92 @@
+"""Cache parsed tracks on disk so unchanged files are not decoded again."""
+
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+from typing import Optional
+
+from .track import PARSER_VERSION, Track
+
+log = logging.getLogger(__name__)
+
+
+class TrackCache:
+    """Keep parsed tracks on disk, keyed by file path, size and mtime.
+
+    Every entry is the pickled Track, whose points are numpy arrays, so entries
+    are compact and quick to read back. Entries live in tracks/v<PARSER_VERSION>
+    under the given directory, older versions in tracks/ are removed when the
+    cache is opened. Nothing else in the given directory is touched.
+
+    Attributes:
+        cache_dir: Directory holding the entries of the current parser version.
+        max_size: Upper bound of the cache size in bytes, least recently used
+            entries are evicted beyond it.
+
+    Methods:
+        get: Return the cached track for a file or None.
+        put: Store the parsed track for a file.
+        evict: Remove least recently used entries until the cache fits max_size.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = 256 * 1024 * 1024):
+        self.max_size = max_size
+        tracks_dir = os.path.join(cache_dir, "tracks")
+        self.cache_dir = os.path.join(tracks_dir, f"v{PARSER_VERSION}")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for name in os.listdir(tracks_dir):
+            path = os.path.join(tracks_dir, name)
+            if path != self.cache_dir and name.startswith("v") and os.path.isdir(path):
+                log.info(f"Removing outdated track cache {path}")
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _entry_path(self, file_name: str) -> Optional[str]:
+        try:
+            st = os.stat(file_name)
+        except OSError:
+            return None
+        key = f"{os.path.abspath(file_name)}:{st.st_size}:{st.st_mtime_ns}"
+        return os.path.join(
+            self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()
+        )
+
+    def get(self, file_name: str) -> Optional[Track]:
+        path = self._entry_path(file_name)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                track = pickle.load(f)
+        except Exception as e:
+            log.info(f"Dropping broken track cache entry for {file_name}: {e}")
+            os.remove(path)
+            return None
+        # the entry mtime is the LRU clock
+        os.utime(path)
+        return track
+
+    def put(self, file_name: str, track: Track):
+        path = self._entry_path(file_name)
+        if path is None:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(track, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                total_size += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
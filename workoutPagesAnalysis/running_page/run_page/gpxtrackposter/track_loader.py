@@ -17,6 +17,7 @@ from generator.db import Activity, init_db
 
 from .exceptions import ParameterError, TrackLoadError
 from .track import Track
+from .track_cache import TrackCache
 from .year_range import YearRange
 
 from synced_data_file_logger import load_synced_file_list
@@ -45,21 +46,41 @@ def load_fit_file(file_name):
     return t
 
 
+def load_file_chunk(load_func, file_names):
+    """Load a chunk of files in one worker call, skipping the ones that fail"""
+    loaded = []
+    for file_name in file_names:
+        try:
+            loaded.append((file_name, load_func(file_name)))
+        except TrackLoadError as e:
+            log.error(f"Error while loading {file_name}: {e}")
+    return loaded
+
+
 class TrackLoader:
     """
     Attributes:
         min_length: All tracks shorter than this value are filtered out.
         special_file_names: Tracks marked as special in command line args
         year_range: All tracks outside of this range will be filtered out.
+        cache_dir: Directory for the parsed track cache, None disables it.
+        cache_max_size: Size cap of the parsed track cache in bytes.
+        max_workers: Number of parser processes, None means one per CPU.
+        chunksize: Number of files handed to a parser process per job.
 
     Methods:
         load_tracks: Load all data from GPX files
+        process_tracks: Filter and merge tracks loaded elsewhere
     """
 
     def __init__(self):
         self.min_length = 100
         self.special_file_names = []
         self.year_range = YearRange()
+        self.cache_dir = None
+        self.cache_max_size = 256 * 1024 * 1024
+        self.max_workers = None
+        self.chunksize = 1
         self.load_func_dict = {
             "gpx": load_gpx_file,
             "tcx": load_tcx_file,
@@ -72,14 +93,35 @@ class TrackLoader:
         print(f"{file_suffix.upper()} files: {len(file_names)}")
 
         tracks = []
-
-        loaded_tracks = self._load_data_tracks(
-            file_names, self.load_func_dict.get(file_suffix, load_gpx_file)
+        cache = (
+            TrackCache(self.cache_dir, self.cache_max_size) if self.cache_dir else None
         )
+        if cache:
+            cached_tracks = {}
+            for file_name in file_names:
+                t = cache.get(file_name)
+                if t is not None:
+                    cached_tracks[file_name] = t
+            file_names = [f for f in file_names if f not in cached_tracks]
+            tracks.extend(cached_tracks.values())
+            log.info(f"Tracks loaded from cache: {len(cached_tracks)}")
+
+        loaded_count = 0
+        for file_name, t in self._load_data_tracks(
+            file_names, self.load_func_dict.get(file_suffix, load_gpx_file)
+        ):
+            tracks.append(t)
+            loaded_count += 1
+            if cache:
+                cache.put(file_name, t)
+        log.info(f"Conventionally loaded tracks: {loaded_count}")
+        if cache:
+            cache.evict()
 
-        tracks.extend(loaded_tracks.values())
-        log.info(f"Conventionally loaded tracks: {len(loaded_tracks)}")
+        return self.process_tracks(tracks)
 
+    def process_tracks(self, tracks):
+        """Filter and merge freshly loaded tracks the way load_tracks does"""
         tracks = self._filter_tracks(tracks)
 
         # merge tracks that took place within one hour
@@ -145,26 +187,32 @@ class TrackLoader:
         log.info(f"Merged {len(tracks) - len(merged_tracks)} track(s)")
         return merged_tracks
 
-    @staticmethod
-    def _load_data_tracks(file_names, load_func=load_gpx_file):
-        """
-        TODO refactor with _load_tcx_tracks
+    def _load_data_tracks(self, file_names, load_func=load_gpx_file):
+        """Parse files in a process pool and yield (file_name, track) as they finish.
+
+        Only two jobs per worker are kept in flight, so parsed tracks are handed to
+        the caller while the pool runs instead of piling up in the parent.
         """
-        tracks = {}
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            future_to_file_name = {
-                executor.submit(load_func, file_name): file_name
-                for file_name in file_names
-            }
-        for future in concurrent.futures.as_completed(future_to_file_name):
-            file_name = future_to_file_name[future]
-            try:
-                t = future.result()
-            except TrackLoadError as e:
-                log.error(f"Error while loading {file_name}: {e}")
-            else:
-                tracks[file_name] = t
-        return tracks
+        if not file_names:
+            return
+        max_workers = self.max_workers or os.cpu_count() or 1
+        chunks = (
+            file_names[i : i + self.chunksize]
+            for i in range(0, len(file_names), self.chunksize)
+        )
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            pending = set()
+            for chunk in chunks:
+                pending.add(executor.submit(load_file_chunk, load_func, chunk))
+                if len(pending) < 2 * max_workers:
+                    continue
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield from future.result()
+            for future in concurrent.futures.as_completed(pending):
+                yield from future.result()
 
     @staticmethod
     def _list_data_files(data_dir, file_suffix):
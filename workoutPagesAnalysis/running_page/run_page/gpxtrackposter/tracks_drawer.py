@@ -6,11 +6,13 @@
 # license that can be found in the LICENSE file.
 
 import argparse
+from typing import List
 
+import numpy as np
 import svgwrite
 
+from .palette import get_palette
 from .poster import Poster
-from .utils import interpolate_color
 from .value_range import ValueRange
 from .xy import XY
 
@@ -30,22 +32,35 @@ class TracksDrawer:
     def draw(self, dr: svgwrite.Drawing, size: XY, offset: XY):
         pass
 
+    def _gradient(self, is_special: bool):
+        if is_special:
+            return self.poster.colors["special"], self.poster.colors["special2"]
+        return self.poster.colors["track"], self.poster.colors["track2"]
+
     def color(
         self, length_range: ValueRange, length: float, is_special: bool = False
     ) -> str:
         assert length_range.is_valid()
 
-        color1 = (
-            self.poster.colors["special"] if is_special else self.poster.colors["track"]
-        )
-        color2 = (
-            self.poster.colors["special2"]
-            if is_special
-            else self.poster.colors["track2"]
-        )
+        color1, color2 = self._gradient(is_special)
 
         diff = length_range.diameter()
         if diff == 0:
             return color1
 
-        return interpolate_color(color1, color2, (length - length_range.lower()) / diff)
+        return get_palette(color1, color2).color((length - length_range.lower()) / diff)
+
+    def colors(
+        self, length_range: ValueRange, lengths, is_special: bool = False
+    ) -> List[str]:
+        """Return the colors of a whole array of lengths, like color() for each."""
+        assert length_range.is_valid()
+
+        color1, color2 = self._gradient(is_special)
+
+        diff = length_range.diameter()
+        if diff == 0:
+            return [color1] * len(lengths)
+
+        ratios = (np.asarray(lengths, dtype=np.float64) - length_range.lower()) / diff
+        return get_palette(color1, color2).colors(ratios)
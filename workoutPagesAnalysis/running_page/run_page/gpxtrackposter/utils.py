@@ -11,6 +11,7 @@ from datetime import datetime
 from typing import List, Optional, Tuple
 
 import colour
+import numpy as np
 import pytz
 import s2sphere as s2
 
@@ -42,7 +43,7 @@ def lat2y(lat_deg: float) -> float:
 
 
 def project(
-    bbox: s2.LatLngRect, size: XY, offset: XY, latlnglines: List[List[s2.LatLng]]
+    bbox: s2.LatLngRect, size: XY, offset: XY, latlnglines: List[np.ndarray]
 ) -> List[List[Tuple[float, float]]]:
     min_x = lng2x(bbox.lng_lo().degrees)
     d_x = lng2x(bbox.lng_hi().degrees) - min_x
@@ -58,22 +59,37 @@ def project(
         return []
     scale = size.x / d_x if size.x / size.y <= d_x / d_y else size.y / d_y
     offset = offset + 0.5 * (size - scale * XY(d_x, -d_y)) - scale * XY(min_x, min_y)
+    lat_interval, lng_interval = bbox.lat(), bbox.lng()
     lines = []
     # If len > $zoom_threshold, choose 1 point out of every $step to reduce size of the SVG file
     zoom_threshold = 400
     for latlngline in latlnglines:
-        line = []
         step = int(len(latlngline) / zoom_threshold) + 1
-        for i in range(0, len(latlngline), step):
-            latlng = latlngline[i]
-            if bbox.contains(latlng):
-                line.append((offset + scale * latlng2xy(latlng)).tuple())
-            else:
-                if len(line) > 0:
-                    lines.append(line)
-                    line = []
-        if len(line) > 0:
-            lines.append(line)
+        points = latlngline[::step]
+        lat = np.radians(points[:, 0])
+        lng = np.radians(points[:, 1])
+        # same as bbox.contains() on every point, s1 intervals treat -pi as pi
+        inside = (lat >= lat_interval.lo()) & (lat <= lat_interval.hi())
+        lng_c = np.where(lng == -math.pi, math.pi, lng)
+        if lng_interval.is_inverted():
+            inside &= (lng_c >= lng_interval.lo()) | (lng_c <= lng_interval.hi())
+            inside &= not lng_interval.is_empty()
+        else:
+            inside &= (lng_c >= lng_interval.lo()) & (lng_c <= lng_interval.hi())
+        if not inside.any():
+            continue
+        xs = offset.x + scale * lng2x(np.degrees(lng))
+        # numpy's log/tan may differ from libm in the last bit, keep math here so
+        # the coordinates stay identical to the per point path
+        ys = [
+            offset.y + scale * lat2y(v) if ok else 0.0
+            for v, ok in zip(np.degrees(lat).tolist(), inside.tolist())
+        ]
+        # split the line wherever it leaves the bbox
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], inside, [False]))))
+        xs = xs.tolist()
+        for start, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            lines.append(list(zip(xs[start:end], ys[start:end])))
     return lines
 
 
@@ -90,23 +106,27 @@ def compute_bounds_xy(lines: List[List[XY]]) -> Tuple[ValueRange, ValueRange]:
 def compute_grid(
     count: int, dimensions: XY
 ) -> Tuple[Optional[float], Optional[Tuple[int, int]]]:
-    # this is somehow suboptimal O(count^2). I guess it's possible in O(count)
+    # For a fixed count_x the cell size only shrinks as count_y grows, so the
+    # smallest count_y that fits all cells has the least waste. That leaves a
+    # single loop over count_x, O(count).
     min_waste = -1.0
     best_size = None
     best_counts = None
     for count_x in range(1, count + 1):
         size_x = dimensions.x / count_x
-        for count_y in range(1, count + 1):
-            if count_x * count_y >= count:
-                size_y = dimensions.y / count_y
-                size = min(size_x, size_y)
-                waste = dimensions.x * dimensions.y - count * size * size
-                if waste < 0:
-                    continue
-                elif best_size is None or waste < min_waste:
-                    best_size = size
-                    best_counts = count_x, count_y
-                    min_waste = waste
+        # rounding can make the waste of the tightest fit slightly negative,
+        # such layouts are skipped and the next count_y is tried
+        for count_y in range(-(-count // count_x), count + 1):
+            size_y = dimensions.y / count_y
+            size = min(size_x, size_y)
+            waste = dimensions.x * dimensions.y - count * size * size
+            if waste < 0:
+                continue
+            if best_size is None or waste < min_waste:
+                best_size = size
+                best_counts = count_x, count_y
+                min_waste = waste
+            break
     return best_size, best_counts
 
 
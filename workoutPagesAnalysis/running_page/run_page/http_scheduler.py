@@ -0,0 +1,242 @@
+"""
+Rate limit aware scheduling of HTTP requests to the sync services.
+Shared by the Garmin and Coros clients so they back off on 429 responses
+instead of failing, and adapt their concurrency to how the host responds.
+"""
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+
+class HostState:
+    """
+    Token bucket, adaptive concurrency limit and statistics of one host.
+    """
+
+    def __init__(self, rate, burst, concurrency):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.refilled_at = time.monotonic()
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.latency = None
+        self.decreased_at = 0.0
+        self.loop = None
+        self.changed = None
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.retries = 0
+        self.total_latency = 0.0
+
+    def take_token(self):
+        """
+        Take a token if there is one, else return the seconds until there is.
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.refilled_at) * self.rate
+        )
+        self.refilled_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def stats(self):
+        done = self.requests - self.errors
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "avg_latency": self.total_latency / done if done else None,
+            "concurrency": int(self.concurrency),
+        }
+
+
+class RequestScheduler:
+    """
+    Schedule requests per host with a token bucket of `rate` requests per
+    second and at most `burst` at once. 429 and 5xx gateway responses are
+    retried after their Retry-After, which holds back the whole host, or
+    else after an exponential backoff of the request alone. Transport
+    errors are retried the same way.
+    The number of concurrent requests per host starts at min_concurrency and
+    grows by one per round of fast responses, up to max_concurrency. It
+    halves on throttling, errors or when a response takes twice the smoothed
+    latency, at most once per round trip and never below min_concurrency.
+    """
+
+    def __init__(
+        self,
+        rate=100.0,
+        burst=100,
+        min_concurrency=10,
+        max_concurrency=32,
+        max_retries=3,
+        backoff=1.0,
+        max_backoff=60.0,
+        smoothing=0.2,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.smoothing = smoothing
+        self.hosts = {}
+
+    def host(self, url):
+        host = httpx.URL(url).host
+        if host not in self.hosts:
+            self.hosts[host] = HostState(self.rate, self.burst, self.min_concurrency)
+        state = self.hosts[host]
+        # asyncio primitives belong to one event loop, scripts may run several
+        loop = asyncio.get_running_loop()
+        if state.loop is not loop:
+            state.loop = loop
+            state.changed = asyncio.Condition()
+            state.in_flight = 0
+        return state
+
+    def stats(self):
+        return {host: state.stats() for host, state in self.hosts.items()}
+
+    def print_stats(self):
+        for host, stats in self.stats().items():
+            latency = stats["avg_latency"]
+            latency = f"{latency:.2f}s" if latency is not None else "-"
+            print(
+                f"{host}: {stats['requests']} requests, {stats['errors']} errors, "
+                f"{stats['throttled']} throttled, {stats['retries']} retries, "
+                f"avg latency {latency}, concurrency {stats['concurrency']}"
+            )
+
+    @asynccontextmanager
+    async def limit(self, url):
+        """
+        Wait for a free slot and a token of the url's host.
+        """
+        state = self.host(url)
+        async with state.changed:
+            while True:
+                delay = state.blocked_until - time.monotonic()
+                if delay <= 0 and state.in_flight < int(state.concurrency):
+                    delay = state.take_token()
+                    if delay <= 0:
+                        break
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(state.changed.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await state.changed.wait()
+            state.in_flight += 1
+            state.requests += 1
+        try:
+            yield state
+        finally:
+            async with state.changed:
+                state.in_flight -= 1
+                state.changed.notify_all()
+
+    def _slow_down(self, state):
+        now = time.monotonic()
+        # the responses of one round trip were sent at the same concurrency,
+        # so only the first of them halves it
+        if state.latency is not None and now - state.decreased_at < state.latency:
+            return
+        state.decreased_at = now
+        state.concurrency = max(self.min_concurrency, state.concurrency / 2)
+
+    def _speed_up(self, state, latency):
+        state.total_latency += latency
+        baseline = state.latency
+        if baseline is None:
+            state.latency = latency
+        else:
+            state.latency += self.smoothing * (latency - baseline)
+        if baseline is not None and latency > 2 * baseline:
+            self._slow_down(state)
+        else:
+            state.concurrency = min(
+                self.max_concurrency, state.concurrency + 1 / state.concurrency
+            )
+
+    def _retry_after(self, response):
+        retry_after = (
+            response.headers.get("Retry-After") if response is not None else None
+        )
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                try:
+                    return max(
+                        0.0,
+                        parsedate_to_datetime(retry_after).timestamp() - time.time(),
+                    )
+                except (TypeError, ValueError):
+                    pass
+        return None
+
+    def _backoff(self, attempt):
+        delay = min(self.max_backoff, self.backoff * 2**attempt)
+        return delay + random.uniform(0, delay / 10)
+
+    async def request(self, client, method, url, retries=None, **kwargs):
+        """
+        Send a request with the httpx.AsyncClient `client`, retrying throttled
+        and failed ones up to `retries` times (default max_retries). Returns
+        the last response, throttled or not, or raises the last transport error.
+        """
+        retries = self.max_retries if retries is None else retries
+        state = self.host(url)
+        for attempt in range(retries + 1):
+            if attempt:
+                state.retries += 1
+            async with self.limit(url):
+                start = time.monotonic()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                except httpx.TransportError:
+                    state.errors += 1
+                    self._slow_down(state)
+                    if attempt == retries:
+                        raise
+                    response = None
+                else:
+                    latency = time.monotonic() - start
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        self._speed_up(state, latency)
+                        return response
+                    state.total_latency += latency
+                    state.throttled += 1
+                    self._slow_down(state)
+                    if attempt == retries:
+                        return response
+            retry_after = self._retry_after(response)
+            if retry_after is not None:
+                # the host asked to wait, so nothing is sent to it until then
+                state.blocked_until = max(
+                    state.blocked_until, time.monotonic() + retry_after
+                )
+            else:
+                await asyncio.sleep(self._backoff(attempt))
+
+
+# shared by all clients, so requests to a host are scheduled together
+scheduler = RequestScheduler()
@@ -1,7 +1,9 @@
 from typing import List, Tuple
+import math
 import polyline
 import os
-from haversine import haversine
+import numpy as np
+from haversine import haversine, haversine_vector
 
 try:
     IGNORE_POLYLINE = (
@@ -33,17 +35,117 @@ def point_in_list_points_range(
     return any([point_distance_in_range(point, p, distance) for p in points])
 
 
+# average earth radius used by haversine
+EARTH_RADIUS_KM = 6371.0088
+# the 27 grid cells around and including a cell
+NEIGHBOR_CELLS = np.array(
+    [(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)]
+)
+
+
+def _to_unit_vectors(points: np.ndarray) -> np.ndarray:
+    lat = np.radians(points[:, 0])
+    lng = np.radians(points[:, 1])
+    return np.column_stack(
+        (np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat))
+    )
+
+
+class PointsRangeIndex:
+    """Answer point_in_list_points_range for many points at once.
+
+    The points are put on a grid of cubes over their unit vectors, with cubes at
+    least as wide as the chord of `distance`, so only the 27 cubes around a query
+    point can hold points in range. Candidates are checked with numpy haversine
+    and the few that land next to `distance` are checked again with the scalar
+    haversine, so results are exactly those of point_in_list_points_range.
+    """
+
+    # numpy trig is not bit identical to math, recheck distances this close
+    TOLERANCE = 1e-9
+
+    def __init__(self, points: List[Tuple[float]], distance: float):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.distance = distance
+        if not len(self.points) or distance <= 0:
+            return
+        xyz = _to_unit_vectors(self.points)
+        angle = min(distance / EARTH_RADIUS_KM, math.pi)
+        chord = 2 * math.sin(angle / 2)
+        self.lo = xyz.min(axis=0)
+        extent = float((xyz.max(axis=0) - self.lo).max())
+        # coarser cubes only add candidates, this keeps the cell keys in an int64
+        self.cell_size = max(chord * (1 + 1e-6), extent / 2**20, 1e-12)
+        cells = self._cells(xyz)
+        self.shape = cells.max(axis=0) + 1
+        keys = np.ravel_multi_index(cells.T, self.shape)
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+
+    def _cells(self, xyz: np.ndarray) -> np.ndarray:
+        return np.floor((xyz - self.lo) / self.cell_size).astype(np.int64)
+
+    def in_range(self, polyline: List[Tuple[float]]) -> np.ndarray:
+        """Return a mask of the polyline points within distance of any point."""
+        queries = np.asarray(polyline, dtype=np.float64).reshape(-1, 2)
+        hidden = np.zeros(len(queries), dtype=bool)
+        if not len(queries) or not len(self.points) or self.distance <= 0:
+            return hidden
+        query_cells = self._cells(_to_unit_vectors(queries))
+        query_idx, point_idx = [], []
+        for offset in NEIGHBOR_CELLS:
+            cells = query_cells + offset
+            valid = np.all((cells >= 0) & (cells < self.shape), axis=1)
+            keys = np.ravel_multi_index(cells[valid].T, self.shape)
+            left = np.searchsorted(self.sorted_keys, keys, side="left")
+            counts = np.searchsorted(self.sorted_keys, keys, side="right") - left
+            # expand each [left, left + count) range into single candidate pairs
+            starts = np.repeat(left - np.cumsum(counts) + counts, counts)
+            query_idx.append(np.repeat(np.flatnonzero(valid), counts))
+            point_idx.append(self.order[starts + np.arange(counts.sum())])
+        query_idx = np.concatenate(query_idx)
+        point_idx = np.concatenate(point_idx)
+        if not len(query_idx):
+            return hidden
+        d = haversine_vector(queries[query_idx], self.points[point_idx])
+        hidden[query_idx[d < self.distance * (1 - self.TOLERANCE)]] = True
+        close = np.abs(d - self.distance) <= self.distance * self.TOLERANCE
+        for q, p in zip(query_idx[close].tolist(), point_idx[close].tolist()):
+            if not hidden[q] and point_distance_in_range(
+                tuple(queries[q].tolist()),
+                tuple(self.points[p].tolist()),
+                self.distance,
+            ):
+                hidden[q] = True
+        return hidden
+
+
 def range_hiding(
     polyline: List[Tuple[float]], points: List[Tuple[float]], distance: int
 ) -> List[Tuple[float]]:
-    return [
-        point
-        for point in polyline
-        if not point_in_list_points_range(point, points, distance)
-    ]
+    return range_hiding_indexed(polyline, PointsRangeIndex(points, distance))
 
 
-def start_end_hiding(polyline: List[Tuple[float]], distance: int) -> List[Tuple[float]]:
+def range_hiding_indexed(
+    polyline: List[Tuple[float]], index: PointsRangeIndex
+) -> List[Tuple[float]]:
+    hidden = index.in_range(polyline)
+    return [point for point, h in zip(polyline, hidden.tolist()) if not h]
+
+
+_ignore_index = None
+
+
+def _get_ignore_index() -> PointsRangeIndex:
+    global _ignore_index
+    if _ignore_index is None:
+        _ignore_index = PointsRangeIndex(IGNORE_POLYLINE, IGNORE_RANGE)
+    return _ignore_index
+
+
+def _start_end_hiding_scalar(
+    polyline: List[Tuple[float]], distance: int
+) -> List[Tuple[float]]:
     start_index, end_index = 0, len(polyline) - 1
 
     starting_distance = 0
@@ -66,6 +168,46 @@ def start_end_hiding(polyline: List[Tuple[float]], distance: int) -> List[Tuple[
     return polyline[start_index : end_index + 1]
 
 
+def _first_beyond(distances: np.ndarray, distance: float):
+    """Index of the first cumulative distance > distance, len if none.
+
+    Returns None when the cumulative distances come so close to `distance` that
+    numpy and math haversine could disagree about the cut.
+    """
+    cumulative = np.cumsum(distances)
+    index = int(np.searchsorted(cumulative, distance, side="right"))
+    tolerance = distance * 1e-9
+    for i in (index - 1, index):
+        if 0 <= i < len(cumulative) and abs(cumulative[i] - distance) <= tolerance:
+            if distance > 0:
+                return None
+    return index
+
+
+def _cut_start_end(
+    polyline: List[Tuple[float]], distances: np.ndarray, distance: int
+) -> List[Tuple[float]]:
+    """start_end_hiding given the distances between consecutive points."""
+    if len(polyline) < 2:
+        return []
+    start = _first_beyond(distances, distance)
+    end = _first_beyond(distances[::-1], distance)
+    if start is None or end is None:
+        return _start_end_hiding_scalar(polyline, distance)
+    start_index = start + 1 if start < len(distances) else 0
+    end_index = len(distances) - 1 - end if end < len(distances) else len(polyline) - 1
+    if start_index >= end_index:
+        return []
+    return polyline[start_index : end_index + 1]
+
+
+def start_end_hiding(polyline: List[Tuple[float]], distance: int) -> List[Tuple[float]]:
+    if len(polyline) < 2:
+        return []
+    points = np.asarray(polyline, dtype=np.float64)
+    return _cut_start_end(polyline, haversine_vector(points[1:], points[:-1]), distance)
+
+
 def filter_out(polyline_str):
     if not polyline_str:
         return
@@ -74,8 +216,48 @@ def filter_out(polyline_str):
         return polyline_str
 
     new_pl = start_end_hiding(pl, IGNORE_START_END_RANGE)
-    new_pl = range_hiding(new_pl, IGNORE_POLYLINE, IGNORE_RANGE)
+    new_pl = range_hiding_indexed(new_pl, _get_ignore_index())
 
     if not new_pl:
         return
     return polyline.encode(new_pl)
+
+
+def filter_out_many(polyline_strs: List[str]) -> List[str]:
+    """filter_out for a whole list of polylines.
+
+    The distances between consecutive points of all polylines come from one
+    haversine_vector call and the ignore range check runs once over all points.
+    """
+    results = [None] * len(polyline_strs)
+    decoded = []
+    for i, polyline_str in enumerate(polyline_strs):
+        if not polyline_str:
+            continue
+        pl = polyline.decode(polyline_str)
+        if not pl:
+            results[i] = polyline_str
+            continue
+        decoded.append((i, pl))
+    if not decoded:
+        return results
+
+    points = np.array([p for _, pl in decoded for p in pl], dtype=np.float64)
+    # distances[j] is from point j to j + 1, including a bogus one across lines
+    distances = haversine_vector(points[1:], points[:-1])
+    trimmed = []
+    offset = 0
+    for _, pl in decoded:
+        line_distances = distances[offset : offset + len(pl) - 1]
+        trimmed.append(_cut_start_end(pl, line_distances, IGNORE_START_END_RANGE))
+        offset += len(pl)
+
+    hidden = _get_ignore_index().in_range([p for pl in trimmed for p in pl])
+    hidden = hidden.tolist()
+    offset = 0
+    for (i, _), pl in zip(decoded, trimmed):
+        new_pl = [p for p, h in zip(pl, hidden[offset : offset + len(pl)]) if not h]
+        offset += len(pl)
+        if new_pl:
+            results[i] = polyline.encode(new_pl)
+    return results
@@ -1,15 +1,41 @@
 import os
-from config import SYNCED_FILE, SYNCED_ACTIVITY_FILE
+from config import SYNCED_FILE, SYNCED_FILE_LOG, SYNCED_ACTIVITY_FILE, SYNC_STATE_FILE
 import json
 
 
-def save_synced_data_file_list(file_list: list):
-    old_list = load_synced_file_list()
+def _write_synced_file_log(names):
+    tmp_file = f"{SYNCED_FILE_LOG}.tmp"
+    with open(tmp_file, "w") as f:
+        f.writelines(f"{name}\n" for name in names)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, SYNCED_FILE_LOG)
+
+
+def _migrate_synced_file_list():
+    """
+    One time migration of the old imported.json list to the append-only log.
+    """
+    names = []
+    if os.path.exists(SYNCED_FILE):
+        with open(SYNCED_FILE, "r") as f:
+            try:
+                names = json.load(f)
+            except Exception as e:
+                print(f"json load {SYNCED_FILE} \nerror {e}")
+    _write_synced_file_log(dict.fromkeys(names))
 
-    with open(SYNCED_FILE, "w") as f:
-        file_list.extend(old_list)
 
-        json.dump(file_list, f)
+def save_synced_data_file_list(file_list: list):
+    synced_files = load_synced_file_list()
+    new_files = [name for name in dict.fromkeys(file_list) if name not in synced_files]
+    if not new_files:
+        return
+    # one write per batch, a crash can leave at most a partial last line
+    with open(SYNCED_FILE_LOG, "a") as f:
+        f.write("".join(f"{name}\n" for name in new_files))
+        f.flush()
+        os.fsync(f.fileno())
 
 
 def save_synced_activity_list(activity_list: list):
@@ -17,16 +43,17 @@ def save_synced_activity_list(activity_list: list):
         json.dump(activity_list, f)
 
 
-def load_synced_file_list():
-    if os.path.exists(SYNCED_FILE):
-        with open(SYNCED_FILE, "r") as f:
-            try:
-                return json.load(f)
-            except Exception as e:
-                print(f"json load {SYNCED_FILE} \nerror {e}")
-                pass
-
-    return []
+def load_synced_file_list() -> set:
+    if not os.path.exists(SYNCED_FILE_LOG):
+        _migrate_synced_file_list()
+    with open(SYNCED_FILE_LOG, "r") as f:
+        content = f.read()
+    lines = content.split("\n")
+    if lines[-1]:
+        # drop the partial line of an interrupted append before appending again
+        print(f"{SYNCED_FILE_LOG} ends with a partial line, dropping it")
+        _write_synced_file_log(lines[:-1])
+    return set(filter(None, lines[:-1]))
 
 
 def load_synced_activity_list():
@@ -39,3 +66,30 @@ def load_synced_activity_list():
                 pass
 
     return []
+
+
+def load_sync_state(key: str):
+    if os.path.exists(SYNC_STATE_FILE):
+        with open(SYNC_STATE_FILE, "r") as f:
+            try:
+                return json.load(f).get(key)
+            except Exception as e:
+                print(f"json load {SYNC_STATE_FILE} \nerror {e}")
+                pass
+
+    return None
+
+
+def save_sync_state(key: str, state: dict):
+    states = {}
+    if os.path.exists(SYNC_STATE_FILE):
+        with open(SYNC_STATE_FILE, "r") as f:
+            try:
+                states = json.load(f)
+            except Exception:
+                pass
+    states[key] = state
+    tmp_file = f"{SYNC_STATE_FILE}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(states, f, indent=2)
+    os.replace(tmp_file, SYNC_STATE_FILE)
@@ -0,0 +1,242 @@
+import asyncio
+import datetime
+import json
+import sqlite3
+import time
+
+import httpx
+import pytest
+
+import garmin_sync
+import generator.db
+import synced_data_file_logger
+from garmin_sync import Garmin, get_downloaded_ids, iter_activity_ids
+from generator.test_db import FakeGeocoder
+from gpxtrackposter.test_track import make_gpx
+from http_scheduler import RequestScheduler
+from utils import make_activities_file
+
+
+class FakeActivityList:
+    """activitylist-service of `total` activities, later pages answer first.
+    Pages from `hang_from` on never answer, by default the ones past the end.
+    """
+
+    def __init__(self, total, hang_from=None):
+        self.total = total
+        self.hang_from = total + 1 if hang_from is None else hang_from
+        self.requested = []
+        self.cancelled = []
+        self.hang = asyncio.Event()
+
+    async def __call__(self, request):
+        start = int(request.url.params["start"])
+        limit = int(request.url.params["limit"])
+        self.requested.append(start)
+        try:
+            if start >= self.hang_from:
+                await self.hang.wait()
+            await asyncio.sleep(0.01 * (10 - start // limit % 10))
+        except asyncio.CancelledError:
+            self.cancelled.append(start)
+            raise
+        ids = range(start, min(start + limit, self.total))
+        return httpx.Response(200, json=[{"activityId": 1000 + i} for i in ids])
+
+
+def make_client(server):
+    client = Garmin.__new__(Garmin)
+    client.req = httpx.AsyncClient(transport=httpx.MockTransport(server))
+    client.modern_url = "https://connect.example.com/modern"
+    client.headers = {}
+    client.is_only_running = False
+    client.scheduler = RequestScheduler(rate=1000, burst=1000)
+    return client
+
+
+async def list_ids(total, **kwargs):
+    server = FakeActivityList(total)
+    client = make_client(server)
+    ids = [
+        i async for i in iter_activity_ids(client, page_size=100, prefetch=4, **kwargs)
+    ]
+    return ids, server
+
+
+@pytest.mark.parametrize("total", [0, 50, 300, 350, 1234])
+def test_pages_are_yielded_in_order_until_the_last_page(total):
+    ids, server = asyncio.run(asyncio.wait_for(list_ids(total), 5))
+    assert ids == [str(1000 + i) for i in range(total)]
+    # the pages past the short or empty one were cancelled, not awaited
+    assert all(
+        start <= total for start in set(server.requested) - set(server.cancelled)
+    )
+    assert len(server.requested) <= total // 100 + 1 + 4
+
+
+def test_start_offset():
+    ids, server = asyncio.run(asyncio.wait_for(list_ids(450, start=200), 5))
+    assert ids == [str(1000 + i) for i in range(200, 450)]
+    assert min(server.requested) == 200
+
+
+def test_early_exit_cancels_the_prefetched_pages():
+    async def first_ids():
+        server = FakeActivityList(10000, hang_from=100)
+        activity_ids = iter_activity_ids(make_client(server), prefetch=4)
+        first = [await activity_ids.__anext__() for _ in range(3)]
+        await activity_ids.aclose()
+        return first, server
+
+    async def main():
+        first, server = await asyncio.wait_for(first_ids(), 5)
+        others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        return first, server, others
+
+    first, server, others = asyncio.run(main())
+    assert first == ["1000", "1001", "1002"]
+    assert server.requested == [0, 100, 200, 300]
+    assert sorted(server.cancelled) == [100, 200, 300]
+    assert others == []
+
+
+class FakeGarmin:
+    """Garmin client serving `activities`, a dict of activity id to GPX."""
+
+    activities = {}
+    download_time = 0
+
+    def __init__(self, secret_string, auth_domain, is_only_running=False):
+        self.req = httpx.AsyncClient()
+        self.scheduler = RequestScheduler()
+
+    async def get_activities(self, start, limit):
+        ids = sorted(self.activities, reverse=True)[start : start + limit]
+        return [{"activityId": int(i)} for i in ids]
+
+    async def download_activity(self, activity_id, file_type="gpx"):
+        await asyncio.sleep(self.download_time)
+        return self.activities[activity_id].encode("utf-8")
+
+
+@pytest.fixture
+def sync_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(generator.db, "geocoder", FakeGeocoder())
+    for name, file_name in (
+        ("SYNCED_FILE", "imported.json"),
+        ("SYNCED_FILE_LOG", "imported.txt"),
+        ("SYNC_STATE_FILE", "sync_state.json"),
+    ):
+        monkeypatch.setattr(synced_data_file_logger, name, str(tmp_path / file_name))
+    gpx_folder = tmp_path / "GPX_OUT"
+    gpx_folder.mkdir()
+    monkeypatch.setattr(garmin_sync, "FOLDER_DICT", {"gpx": str(gpx_folder)})
+    monkeypatch.setattr(garmin_sync, "SQL_FILE", str(tmp_path / "data.db"))
+    monkeypatch.setattr(garmin_sync, "JSON_FILE", str(tmp_path / "activities.json"))
+    monkeypatch.setattr(garmin_sync, "Garmin", FakeGarmin)
+    monkeypatch.setattr(FakeGarmin, "activities", make_activities(30, 120))
+    return tmp_path
+
+
+def make_activities(count, points):
+    start = datetime.datetime(2024, 1, 1, 6, 0)
+    return {
+        str(10_000_000_000 + i): make_gpx(
+            [points], seed=i, start=start + datetime.timedelta(days=i)
+        )
+        for i in range(count)
+    }
+
+
+def sync(sync_dir, **kwargs):
+    folder = str(sync_dir / "GPX_OUT")
+    return asyncio.run(
+        garmin_sync.sync_new_activities(
+            "secret", "COM", get_downloaded_ids(folder), False, folder, "gpx", **kwargs
+        )
+    )
+
+
+def activity_rows(sql_file):
+    with sqlite3.connect(sql_file) as connection:
+        return sorted(connection.execute("SELECT * FROM activities").fetchall())
+
+
+def make_reference(sync_dir):
+    # what downloading everything, then make_activities_file, stored
+    reference = sync_dir / "reference"
+    reference.mkdir()
+    for activity_id, gpx in FakeGarmin.activities.items():
+        (reference / f"{activity_id}.gpx").write_text(gpx)
+    synced_file_log = synced_data_file_logger.SYNCED_FILE_LOG
+    synced_data_file_logger.SYNCED_FILE_LOG = str(sync_dir / "reference.txt")
+    try:
+        make_activities_file(
+            str(sync_dir / "reference.db"),
+            str(reference),
+            str(sync_dir / "reference.json"),
+        )
+    finally:
+        synced_data_file_logger.SYNCED_FILE_LOG = synced_file_log
+
+
+def test_sync_pipeline_stores_what_make_activities_file_did(sync_dir):
+    make_reference(sync_dir)
+    # left from an interrupted sync: downloaded, but never imported
+    leftover = sorted(FakeGarmin.activities)[:8]
+    for activity_id in leftover:
+        gpx = FakeGarmin.activities[activity_id]
+        (sync_dir / "GPX_OUT" / f"{activity_id}.gpx").write_text(gpx)
+
+    new_ids = sync(sync_dir, workers=2)
+    assert sorted(new_ids) == sorted(set(FakeGarmin.activities) - set(leftover))
+    assert activity_rows(sync_dir / "data.db") == activity_rows(
+        sync_dir / "reference.db"
+    )
+    assert json.loads((sync_dir / "activities.json").read_text()) == json.loads(
+        (sync_dir / "reference.json").read_text()
+    )
+    assert synced_data_file_logger.load_synced_file_list() == {
+        f"{activity_id}.gpx" for activity_id in FakeGarmin.activities
+    }
+
+
+def test_sync_pipeline_skips_synced_files(sync_dir, capsys):
+    sync(sync_dir, workers=2)
+    rows = activity_rows(sync_dir / "data.db")
+    capsys.readouterr()
+
+    assert sync(sync_dir, workers=2) == []
+    assert "Unsynced files: 0" in capsys.readouterr().out
+    assert activity_rows(sync_dir / "data.db") == rows
+
+
+@pytest.mark.slow
+def test_benchmark_sync_pipeline_against_download_then_parse(sync_dir, monkeypatch):
+    monkeypatch.setattr(FakeGarmin, "activities", make_activities(100, 1000))
+    monkeypatch.setattr(FakeGarmin, "download_time", 0.5)
+    start = time.perf_counter()
+    sync(sync_dir)
+    pipeline_time = time.perf_counter() - start
+
+    # the sync before the pipeline, downloading everything first
+    folder = str(sync_dir / "sequential")
+    monkeypatch.setitem(garmin_sync.FOLDER_DICT, "gpx", folder)
+    (sync_dir / "sequential").mkdir()
+    (sync_dir / "imported.txt").unlink()
+    start = time.perf_counter()
+    asyncio.run(
+        garmin_sync.download_new_activities("secret", "COM", [], False, folder, "gpx")
+    )
+    make_activities_file(
+        str(sync_dir / "sequential.db"), folder, str(sync_dir / "sequential.json")
+    )
+    sequential_time = time.perf_counter() - start
+    print(
+        f"\n100 activities: pipeline {pipeline_time:.2f}s, "
+        f"download then parse {sequential_time:.2f}s"
+    )
+    assert activity_rows(sync_dir / "data.db") == activity_rows(
+        sync_dir / "sequential.db"
+    )
+    assert pipeline_time < sequential_time
@@ -0,0 +1,189 @@
+import asyncio
+import random
+import time
+
+import httpx
+import pytest
+
+from http_scheduler import RequestScheduler
+
+URL = "https://connect.example.com/activity"
+
+
+class FakeServer:
+    """Answers after `latency(n)` seconds, with a 429 when `throttle(n)` is true,
+    n counting the requests it got so far.
+    """
+
+    def __init__(self, latency, throttle=lambda n: False, retry_after=None):
+        self.latency = latency
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.arrivals = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.start = time.monotonic()
+
+    async def __call__(self, request):
+        n = len(self.arrivals)
+        self.arrivals.append((time.monotonic() - self.start, request.url.path))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency(n))
+        finally:
+            self.in_flight -= 1
+        if self.throttle(n):
+            headers = {"Retry-After": self.retry_after} if self.retry_after else {}
+            return httpx.Response(429, headers=headers)
+        return httpx.Response(200, text=request.url.path)
+
+
+async def send_all(scheduler, server, count):
+    async with httpx.AsyncClient(transport=httpx.MockTransport(server)) as client:
+        start = time.monotonic()
+        responses = await asyncio.gather(
+            *(scheduler.request(client, "GET", f"{URL}/{i}") for i in range(count))
+        )
+        return responses, time.monotonic() - start
+
+
+async def send_with_semaphore(server, count):
+    # the fixed semaphore the downloads used before the scheduler
+    semaphore = asyncio.Semaphore(10)
+
+    async def send(client, i):
+        async with semaphore:
+            return await client.get(f"{URL}/{i}")
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(server)) as client:
+        start = time.monotonic()
+        await asyncio.gather(*(send(client, i) for i in range(count)))
+        return time.monotonic() - start
+
+
+@pytest.mark.parametrize(
+    "scale", [0.1, pytest.param(1.0, marks=pytest.mark.slow)], ids=["fast", "full"]
+)
+def test_slow_responses_keep_the_semaphore_throughput(scale):
+    latencies = [scale * random.Random(0).uniform(0.1, 0.6) for _ in range(100)]
+
+    def latency(n):
+        return latencies[n % 100]
+
+    scheduler = RequestScheduler()
+    server = FakeServer(latency)
+    responses, elapsed = asyncio.run(send_all(scheduler, server, 100))
+    semaphore_elapsed = asyncio.run(send_with_semaphore(FakeServer(latency), 100))
+    print(f"\nscheduler {elapsed:.2f}s, semaphore {semaphore_elapsed:.2f}s")
+    assert all(r.status_code == 200 for r in responses)
+    assert server.max_in_flight >= 10
+    assert elapsed < 1.2 * semaphore_elapsed
+    assert scheduler.stats()["connect.example.com"]["concurrency"] >= 10
+
+
+def test_throttled_requests_are_retried_without_holding_back_the_host():
+    def throttle(n):
+        return n % 7 == 6
+
+    # a bucket that never runs out, the time left is the backoffs
+    scheduler = RequestScheduler(rate=1000, burst=1000, backoff=0.2)
+    server = FakeServer(lambda n: 0.02, throttle)
+    responses, elapsed = asyncio.run(send_all(scheduler, server, 200))
+    stats = scheduler.stats()["connect.example.com"]
+    assert [r.text for r in responses] == [f"/activity/{i}" for i in range(200)]
+    assert stats["throttled"] == stats["retries"] == len(server.arrivals) - 200
+    assert stats["throttled"] >= 200 // 7
+    # each throttled request waits for itself only, the unluckiest one through
+    # all three backoffs, instead of every throttle holding back the host
+    backoffs = (0.2 + 0.4 + 0.8) * 1.1
+    assert elapsed < 200 * 0.02 / 10 + backoffs + 4 * 0.02 + 0.5
+
+
+def test_retry_after_holds_back_the_host():
+    async def main():
+        server = FakeServer(lambda n: 0.01, lambda n: n == 0, retry_after="0.3")
+        scheduler = RequestScheduler()
+        async with httpx.AsyncClient(transport=httpx.MockTransport(server)) as client:
+            first = asyncio.ensure_future(scheduler.request(client, "GET", f"{URL}/0"))
+            await asyncio.sleep(0.05)
+            others = [scheduler.request(client, "GET", f"{URL}/{i}") for i in (1, 2)]
+            responses = await asyncio.gather(first, *others)
+        return server, responses
+
+    server, responses = asyncio.run(main())
+    assert [r.status_code for r in responses] == [200] * 3
+    assert len(server.arrivals) == 4
+    # the requests sent while the host was held back waited for it too
+    assert all(at >= 0.3 for at, _ in server.arrivals[1:])
+
+
+def test_transport_errors_delay_only_their_own_request():
+    failed = []
+
+    async def server(request):
+        if request.url.path.endswith("/flaky") and not failed:
+            failed.append(time.monotonic())
+            raise httpx.ConnectError("connection refused", request=request)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200)
+
+    async def main():
+        scheduler = RequestScheduler(backoff=0.5)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(server)) as client:
+
+            async def timed(path):
+                start = time.monotonic()
+                response = await scheduler.request(client, "GET", URL + path)
+                return response.status_code, time.monotonic() - start
+
+            flaky = asyncio.ensure_future(timed("/flaky"))
+            await asyncio.sleep(0.01)
+            others = await asyncio.gather(*(timed(f"/{i}") for i in range(20)))
+            return await flaky, others, scheduler.stats()
+
+    flaky, others, stats = asyncio.run(main())
+    assert flaky[0] == 200 and flaky[1] >= 0.5
+    assert all(status == 200 and elapsed < 0.3 for status, elapsed in others)
+    assert stats["connect.example.com"]["errors"] == 1
+
+
+def test_transport_errors_are_raised_after_the_retries():
+    async def server(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    async def main():
+        scheduler = RequestScheduler(max_retries=2, backoff=0.01)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(server)) as client:
+            with pytest.raises(httpx.ConnectError):
+                await scheduler.request(client, "GET", URL)
+        return scheduler.stats()["connect.example.com"]
+
+    stats = asyncio.run(main())
+    assert stats["requests"] == stats["errors"] == 3
+    assert stats["retries"] == 2
+
+
+def test_concurrency_halves_once_per_round_trip_down_to_the_floor():
+    async def main():
+        scheduler = RequestScheduler(min_concurrency=10, max_concurrency=64)
+        state = scheduler.host(URL)
+        assert state.concurrency == 10
+        for _ in range(2000):
+            scheduler._speed_up(state, 0.05)
+        assert state.concurrency == 64
+        assert state.latency == pytest.approx(0.05)
+
+        # a response at twice the smoothed latency halves the concurrency,
+        # the other slow responses of that round trip don't
+        scheduler._speed_up(state, 0.11)
+        assert state.concurrency == 32
+        scheduler._slow_down(state)
+        assert state.concurrency == 32
+        # a round trip later they do again, but not below the floor
+        for _ in range(3):
+            state.decreased_at -= 1
+            scheduler._slow_down(state)
+        assert state.concurrency == 10
+
+    asyncio.run(main())
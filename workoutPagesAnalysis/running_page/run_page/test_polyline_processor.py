@@ -0,0 +1,132 @@
+import random
+import time
+
+import numpy as np
+import polyline
+import pytest
+from haversine import haversine
+
+import polyline_processor as pp
+from polyline_processor import (
+    PointsRangeIndex,
+    _first_beyond,
+    _start_end_hiding_scalar,
+    filter_out,
+    filter_out_many,
+    point_in_list_points_range,
+    start_end_hiding,
+)
+
+
+def random_polyline(rng, points, lat=31.2, lng=121.4):
+    line = []
+    for _ in range(points):
+        lat += rng.uniform(-3e-4, 3e-4)
+        lng += rng.uniform(-3e-4, 3e-4)
+        line.append((round(lat, 5), round(lng, 5)))
+    return line
+
+
+def old_filter_out(polyline_str, ignore_polyline, ignore_range, start_end_range):
+    # filter_out as it was before the numpy version
+    if not polyline_str:
+        return
+    pl = polyline.decode(polyline_str)
+    if not pl:
+        return polyline_str
+    new_pl = _start_end_hiding_scalar(pl, start_end_range)
+    new_pl = [
+        point
+        for point in new_pl
+        if not point_in_list_points_range(point, ignore_polyline, ignore_range)
+    ]
+    if not new_pl:
+        return
+    return polyline.encode(new_pl)
+
+
+def test_range_index_matches_point_in_list_points_range():
+    rng = random.Random(0)
+    for _ in range(30):
+        line = random_polyline(rng, rng.randint(1, 300))
+        points = random_polyline(rng, rng.randint(1, 20))
+        query = rng.choice(line)
+        # mirrored points are exactly as far from the query point as each other,
+        # and exactly at distance, which is not in range
+        dlat, dlng = rng.uniform(-2e-3, 2e-3), rng.uniform(-2e-3, 2e-3)
+        points += [
+            (query[0] + dlat, query[1] + dlng),
+            (query[0] + dlat, query[1] - dlng),
+        ]
+        line.append(query)
+        for distance in (haversine(query, points[-1]), rng.uniform(0.01, 0.2), 0):
+            index = PointsRangeIndex(points, distance)
+            expected = [point_in_list_points_range(p, points, distance) for p in line]
+            assert index.in_range(line).tolist() == expected
+
+
+def test_start_end_hiding_matches_scalar_version():
+    rng = random.Random(1)
+    for _ in range(200):
+        line = random_polyline(rng, rng.randint(0, 200))
+        distances = [haversine(a, b) for a, b in zip(line[1:], line[:-1])]
+        cut = rng.randrange(len(distances)) if distances else 0
+        # the scalar sum at a point makes that point exactly at distance
+        for distance in (sum(distances[: cut + 1]), rng.uniform(0, 0.5), 0):
+            assert start_end_hiding(line, distance) == _start_end_hiding_scalar(
+                line, distance
+            )
+
+
+def test_first_beyond_falls_back_next_to_distance():
+    distances = np.array([0.1, 0.2, 0.3])
+    assert _first_beyond(distances, 0.25) == 1
+    assert _first_beyond(distances, 1.0) == 3
+    # a cumulative distance this close to the cut is left to the scalar version
+    assert _first_beyond(distances, 0.1 + 0.2) is None
+    assert _first_beyond(distances, 0.3 * (1 + 1e-12)) is None
+    assert _first_beyond(distances, 0) == 0
+
+
+@pytest.fixture
+def ignore_settings(monkeypatch):
+    rng = random.Random(2)
+    ignore_polyline = random_polyline(rng, 15)
+    ignore_range, start_end_range = 0.05, 0.2
+    monkeypatch.setattr(pp, "IGNORE_START_END_RANGE", start_end_range)
+    monkeypatch.setattr(
+        pp, "_ignore_index", PointsRangeIndex(ignore_polyline, ignore_range)
+    )
+    return ignore_polyline, ignore_range, start_end_range
+
+
+def test_filter_out_many_matches_old_filter_out(ignore_settings):
+    rng = random.Random(3)
+    polyline_strs = ["", None]
+    for _ in range(50):
+        polyline_strs.append(polyline.encode(random_polyline(rng, rng.randint(1, 400))))
+    rng.shuffle(polyline_strs)
+    expected = [old_filter_out(s, *ignore_settings) for s in polyline_strs]
+    assert [filter_out(s) for s in polyline_strs] == expected
+    assert filter_out_many(polyline_strs) == expected
+
+
+@pytest.mark.slow
+def test_benchmark_filter_out_many(ignore_settings):
+    rng = random.Random(4)
+    polyline_strs = [polyline.encode(random_polyline(rng, 1000)) for _ in range(500)]
+    start = time.perf_counter()
+    expected = [old_filter_out(s, *ignore_settings) for s in polyline_strs]
+    old_time = time.perf_counter() - start
+    start = time.perf_counter()
+    single = [filter_out(s) for s in polyline_strs]
+    single_time = time.perf_counter() - start
+    start = time.perf_counter()
+    many = filter_out_many(polyline_strs)
+    many_time = time.perf_counter() - start
+    print(
+        f"\n500 polylines of 1000 points: old {old_time:.2f}s, "
+        f"filter_out {single_time:.2f}s, filter_out_many {many_time:.2f}s"
+    )
+    assert single == expected and many == expected
+    assert many_time < old_time
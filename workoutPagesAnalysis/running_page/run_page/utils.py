@@ -1,4 +1,5 @@
 import json
+import os
 import time
 from datetime import datetime
 
@@ -12,6 +13,8 @@ from generator import Generator
 from stravalib.client import Client
 from stravalib.exc import RateLimitExceeded
 
+FULL_EXPORT = os.getenv("FULL_EXPORT", False)
+
 
 def adjust_time(time, tz_name):
     tc_offset = datetime.now(pytz.timezone(tz_name)).utcoffset()
@@ -48,12 +51,80 @@ def to_date(ts):
     raise ValueError(f"cannot parse timestamp {ts} into date with fmts: {ts_fmts}")
 
 
-def make_activities_file(sql_file, data_dir, json_file, file_suffix="gpx"):
+def load_activities_file(json_file):
+    try:
+        with open(json_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_activities_file(activities_list, json_file):
+    """Write the json next to json_file first, so readers never see a partial file."""
+    tmp_file = f"{json_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(activities_list, f)
+    os.replace(tmp_file, json_file)
+
+
+def load_export_mark(json_file):
+    try:
+        with open(f"{json_file}.mark", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_export_mark(activities_list, json_file):
+    """Write the high-water mark of an export, after the export itself."""
+    mark = {
+        "count": len(activities_list),
+        "run_id": max((a["run_id"] for a in activities_list), default=None),
+        "start_date_local": max(
+            (a["start_date_local"] for a in activities_list), default=None
+        ),
+    }
+    tmp_file = f"{json_file}.mark.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(mark, f)
+    os.replace(tmp_file, f"{json_file}.mark")
+
+
+def make_activities_file(
+    sql_file, data_dir, json_file, file_suffix="gpx", incremental=True
+):
     generator = Generator(sql_file)
     generator.sync_from_data_dir(data_dir, file_suffix=file_suffix)
-    activities_list = generator.load()
-    with open(json_file, "w") as f:
-        json.dump(activities_list, f)
+    export_activities_file(generator, json_file, incremental)
+
+
+def export_activities_file(generator, json_file, incremental=True):
+    """Export the activities to json_file.
+
+    An incremental export only redoes the activities from the earliest one
+    changed by the generator's syncs or stored after the last export's mark.
+    Set FULL_EXPORT in the environment, or pass incremental=False, to rebuild
+    the whole file.
+    """
+    previous_activities = None
+    if incremental and not FULL_EXPORT:
+        previous_activities = load_activities_file(json_file)
+        mark = load_export_mark(json_file)
+        if (
+            previous_activities is None
+            or mark is None
+            or mark.get("count") != len(previous_activities)
+        ):
+            # the mark is missing or belongs to another export, rebuild
+            previous_activities = None
+        else:
+            generator.mark_changed_after(mark)
+            if generator.changed_since is None:
+                # nothing new was stored, the last export is still up to date
+                return
+    activities_list = generator.load(previous_activities)
+    write_activities_file(activities_list, json_file)
+    write_export_mark(activities_list, json_file)
 
 
 def make_strava_client(client_id, client_secret, refresh_token):